@@ -58,6 +58,16 @@ class PathRegistry:
         return files
 
 
+def load_config(fname: str) -> dict[str, Any]:
+    """Load a YAML configuration file from the config directory, empty if it doesn't exist."""
+    path = PathRegistry.get_config_file(fname)
+    if not path.exists():
+        return {}
+
+    with path.open("r") as fh:
+        return yaml.safe_load(fh.read()) or {}
+
+
 def setup_logging():
     def merge_logging_configs(
         paths: Iterable[Path], allow_overwrite: bool = False
@@ -1,13 +1,46 @@
+"""
+Docker health probe of the DNS updater.
+
+Only the standard library is used (no `providers` import, which pulls `requests` and `pydantic`),
+so that the probe runs well within the health check timeout, even with `python -S`.
+"""
+
+import json
+import os
 import sys
+import time
+from datetime import datetime
 from pathlib import Path
 
-from providers import DNSUpdateResult
+# maximum age of the last successful run, defaults to 3 update intervals
+MAX_AGE = float(
+    os.environ.get(
+        "DNS_HEALTH_MAX_AGE", 3 * float(os.environ.get("DNS_UPDATE_INTERVAL", 600))
+    )
+)
+
+
+def check_logs(file: Path) -> str | None:
+    """Return the reason why the state file is unhealthy, None if it is healthy."""
+    try:
+        state = json.loads(file.read_text())
+    except (OSError, ValueError) as e:
+        return f"cannot read state: {e}"
+
+    # same as DNSUpdateResult.is_successful
+    success = state.get("success")
+    if state.get("ip") is None or state.get("errors") or success is False:
+        return "last run failed"
 
+    if timestamp := state.get("timestamp"):
+        last_run = datetime.fromisoformat(timestamp).timestamp()
+    else:
+        last_run = file.stat().st_mtime
 
-def check_logs(file: Path) -> bool:
-    res = DNSUpdateResult.model_validate_json(file.read_text())
+    if (age := time.time() - last_run) > MAX_AGE:
+        return f"last successful run is {age:.0f}s old"
 
-    return res.is_successful
+    return None
 
 
 def main():
@@ -15,8 +48,8 @@ def main():
     files = path.glob("state_*.json")
 
     for f in files:
-        if not check_logs(f):
-            print(f"DNS health check failed: {f}")
+        if reason := check_logs(f):
+            print(f"DNS health check failed: {f}: {reason}")
             sys.exit(1)
 
 
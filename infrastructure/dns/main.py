@@ -1,14 +1,128 @@
+import argparse
 import logging
+import os
+import random
+import signal
+import threading
+from pathlib import Path
 
 from dotenv import load_dotenv
-from providers.cloudflare import CloudFlareDNSProvider
-from providers.duckdns import DuckDNSProvider
+from prometheus_client import start_http_server
+from providers import discover_providers, get_enabled_providers, load_providers
+from providers.base import BaseDNSProvider
+from providers.runner import ProviderRunner
 
 logger = logging.getLogger(__name__)
 
+
+def run_forever(
+    runner: ProviderRunner,
+    interval: float,
+    jitter: float,
+    stop: threading.Event,
+):
+    """
+    Keep a single process alive and run the providers every `interval` seconds, +/- `jitter` seconds.
+    The runner and its provider instances (and the imported modules) are reused between ticks.
+    """
+    logger.info(f"starting DNS updater daemon, interval={interval}s, jitter={jitter}s")
+    while not stop.is_set():
+        runner.run()
+
+        delay = max(interval + random.uniform(-jitter, jitter), 0)
+        logger.debug(f"next run in {delay:.1f}s")
+        stop.wait(delay)
+
+    logger.info("DNS updater daemon stopped")
+
+
+def remove_disabled_states(providers: list[BaseDNSProvider]):
+    """
+    Delete the state files of the providers that are not run anymore, which would otherwise get older than
+    the maximum age of the health probe and keep the container unhealthy.
+    """
+    enabled = {p.PATH_STATE_OUTPUT for p in providers}
+    for f in Path(__file__).absolute().parent.joinpath("logs").glob("state_*.json"):
+        if f not in enabled:
+            logger.info(f"removing state file {f.name} of a disabled provider")
+            f.unlink(missing_ok=True)
+
+
+def list_providers():
+    enabled = {spec.name for spec in get_enabled_providers()}
+    for name, spec in discover_providers().items():
+        configured = "configured" if spec.is_configured else "not configured"
+        status = "enabled" if name in enabled else "disabled"
+        print(f"{name}: {configured}, {status} ({spec.target})")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Update DNS records with the public IP."
+    )
+    parser.add_argument(
+        "--list",
+        action="store_true",
+        help="list the available providers and exit",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="keep running and update the records periodically instead of running once",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=float(os.environ.get("DNS_UPDATE_INTERVAL", 600)),
+        help="seconds between two runs in daemon mode (env: DNS_UPDATE_INTERVAL)",
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=float(os.environ.get("DNS_UPDATE_JITTER", 30)),
+        help="maximum random offset in seconds added to the interval (env: DNS_UPDATE_JITTER)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=float(os.environ.get("DNS_PROVIDER_TIMEOUT", 60)),
+        help="maximum duration in seconds of a provider run (env: DNS_PROVIDER_TIMEOUT)",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=int(os.environ.get("DNS_METRICS_PORT", 9110)),
+        help="port of the Prometheus exporter in daemon mode, 0 to disable (env: DNS_METRICS_PORT)",
+    )
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    args = parse_args()
     logging.basicConfig(level=logging.INFO)
     logger.info(f"loaded dotenv: {load_dotenv()}")
 
-    CloudFlareDNSProvider().run()
-    DuckDNSProvider().run()
+    if args.list:
+        list_providers()
+        raise SystemExit()
+
+    providers = load_providers(get_enabled_providers())
+    if not providers:
+        logger.warning("no DNS provider configured")
+    remove_disabled_states(providers)
+    runner = ProviderRunner(providers, timeout=args.timeout)
+
+    if not args.daemon:
+        runner.run()
+    else:
+        if args.metrics_port:
+            start_http_server(args.metrics_port)
+            logger.info(f"serving metrics on port {args.metrics_port}")
+
+        stop = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+
+        run_forever(runner, args.interval, args.jitter, stop)
+
+    runner.shutdown()
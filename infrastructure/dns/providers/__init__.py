@@ -1 +1,6 @@
 from .base import DNSUpdateResult  # noqa: F401
+from .registry import (  # noqa: F401
+    discover_providers,
+    get_enabled_providers,
+    load_providers,
+)
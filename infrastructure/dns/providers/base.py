@@ -1,20 +1,105 @@
+import hashlib
+import json
 import logging
 import os
+import time
 from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
 from functools import lru_cache
 from pathlib import Path
 from typing import Any
 
 import requests
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import metrics
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class MeteredRetry(Retry):
+    """
+    Retry policy counting retries in the metrics. Besides idempotent requests, writes (POST, PATCH)
+    are retried on 429 and 503 responses, which mean that the request was not processed.
+    Connection errors and other statuses of writes are not retried, the write may have been applied.
+    """
+
+    WRITE_METHODS = frozenset({"POST", "PATCH"})
+    WRITE_RETRY_STATUSES = frozenset({429, 503})
+
+    def is_retry(self, method, status_code, has_retry_after=False) -> bool:
+        if method.upper() in self.WRITE_METHODS:
+            return bool(self.total) and status_code in self.WRITE_RETRY_STATUSES
+        return super().is_retry(method, status_code, has_retry_after)
+
+    def increment(self, method=None, url=None, *args, _pool=None, **kwargs):
+        # raises MaxRetryError when the retries are exhausted, the request is then not retried
+        retry = super().increment(method, url, *args, _pool=_pool, **kwargs)
+        metrics.API_RETRIES.labels(host=_pool.host if _pool else None).inc()
+        return retry
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTP adapter applying a default (connect, read) timeout to every request."""
+
+    def __init__(self, *args, timeout: tuple[float, float], **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+@lru_cache
+def get_http_session() -> requests.Session:
+    """
+    HTTP session shared by all providers: connections are kept alive and pooled per host,
+    requests time out, and 429/5xx responses are retried with exponential backoff, honoring `Retry-After`.
+    """
+    retry = MeteredRetry(
+        total=int(os.environ.get("DNS_HTTP_RETRIES", 3)),
+        backoff_factor=float(os.environ.get("DNS_HTTP_BACKOFF", 0.5)),
+        status_forcelist=(429, 500, 502, 503, 504),
+        respect_retry_after_header=True,
+        # return the last response instead of raising, providers handle error statuses
+        raise_on_status=False,
+    )
+    timeout = (
+        float(os.environ.get("DNS_HTTP_CONNECT_TIMEOUT", 5)),
+        float(os.environ.get("DNS_HTTP_READ_TIMEOUT", 15)),
+    )
+    adapter = TimeoutHTTPAdapter(
+        timeout=timeout, max_retries=retry, pool_connections=4, pool_maxsize=8
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.hooks["response"].append(metrics.observe_response)
+    return session
 
 
 class DNSUpdateResult(BaseModel):
     ip: str | None
+    ipv6: str | None = None
     success: bool | None = None
     messages: list[str] = Field(default_factory=list)
     errors: list[str] = Field(default_factory=list)
     result: Any = None
+    # time of the run that produced this result
+    timestamp: datetime = Field(default_factory=utcnow)
+    # time of the last successful write to the provider
+    updated_at: datetime | None = None
+    # True if no provider API call was made because the IP did not change
+    skipped: bool = False
+    # fingerprint of the record set written to the provider
+    records_hash: str | None = None
 
     model_config = ConfigDict(extra="allow")
 
@@ -37,42 +122,160 @@ class BaseDNSProvider(ABC):
 
     def __init__(self):
         self.logger = logging.getLogger(self.__class__.__name__)
+        self.session = get_http_session()
+        self.force_refresh_interval = timedelta(
+            seconds=float(os.environ.get("DNS_FORCE_REFRESH_INTERVAL", 86400))
+        )
+        # last result, kept in memory so that a resident process doesn't re-read the state file
+        self._state: DNSUpdateResult | None = None
+
+    def run(
+        self, ip: str | None = None, ipv6: str | None = None, resolved: bool = False
+    ) -> DNSUpdateResult:
+        """
+        Update the records to the public IPs, resolved unless given or `resolved` is set
+        (resolved once for all providers, `ip` is None if the resolution failed).
+        """
+        if ip is None and not resolved:
+            ip, ipv6 = self.get_public_ips()
+        previous = self.load_state()
 
-    def run(self) -> DNSUpdateResult:
+        start = time.perf_counter()
         try:
-            self.logger.info("starting DNS provider run")
-            res = self._run()
+            if ip is None:
+                raise RuntimeError("could not resolve the public IP")
+
+            records_hash = self.get_records_hash()
+            if self.is_up_to_date(ip, ipv6, records_hash, previous):
+                self.logger.info(f"public IP unchanged ({ip}), skipping update")
+                res = DNSUpdateResult(
+                    ip=ip,
+                    ipv6=ipv6,
+                    success=True,
+                    skipped=True,
+                    messages=["public IP unchanged"],
+                    result=previous.result,
+                    updated_at=previous.updated_at,
+                    records_hash=records_hash,
+                )
+            else:
+                self.logger.info("starting DNS provider run")
+                res = self._run(ip, ipv6)
+                if res.is_successful:
+                    res.updated_at = res.timestamp
+                    res.records_hash = records_hash
         except Exception as e:
             self.logger.fatal("unexpected error", exc_info=True)
-            res = DNSUpdateResult(
-                success=False,
-                ip=self.get_public_ip(),
-                errors=[f"{e.__class__.__name__}: {e}"],
+            res = self.error_result(ip, e, ipv6)
+
+        metrics.RUN_DURATION.labels(self.name).observe(time.perf_counter() - start)
+        if res.is_successful:
+            metrics.LAST_SUCCESS.labels(self.name).set_to_current_time()
+            outcome = "skipped" if res.skipped else "written"
+        else:
+            outcome = "failed"
+        metrics.UPDATES.labels(self.name, outcome).inc()
+
+        self.save_state(res)
+        return res
+
+    def error_result(
+        self, ip: str | None, error: Exception, ipv6: str | None = None
+    ) -> DNSUpdateResult:
+        previous = self.load_state()
+        return DNSUpdateResult(
+            success=False,
+            ip=ip,
+            ipv6=ipv6,
+            errors=[f"{error.__class__.__name__}: {error}"],
+            updated_at=previous.updated_at if previous else None,
+        )
+
+    def refresh_due(self, previous: DNSUpdateResult | None) -> bool:
+        """
+        True if the live records must be checked: the last run failed,
+        or the last write to the provider is older than the forced refresh interval.
+        """
+        if previous is None or not previous.is_successful:
+            return True
+        if previous.updated_at is None:
+            return True
+
+        return utcnow() - previous.updated_at >= self.force_refresh_interval
+
+    def is_up_to_date(
+        self,
+        ip: str,
+        ipv6: str | None,
+        records_hash: str,
+        previous: DNSUpdateResult | None,
+    ) -> bool:
+        """
+        The records are up-to-date if the last run succeeded with the same IPs and record set,
+        and no refresh is due.
+        """
+        if self.refresh_due(previous):
+            return False
+
+        return (
+            previous.ip == ip
+            and previous.ipv6 == ipv6
+            and previous.records_hash == records_hash
+        )
+
+    def get_record_set(self) -> list | None:
+        """
+        Records of this provider declared in the record set file (`DNS_RECORDS_FILE`),
+        None if the file doesn't declare any.
+        """
+        path = Path(
+            os.environ.get(
+                "DNS_RECORDS_FILE",
+                Path(__file__).absolute().parent.parent / "records.json",
             )
+        )
+        if not path.exists():
+            return None
+
+        return json.loads(path.read_text()).get(self.name)
 
+    def get_records(self) -> list:
+        """Records managed by this provider."""
+        return self.get_record_set() or []
+
+    def get_records_hash(self) -> str:
+        records = json.dumps(
+            self.get_records(), default=BaseModel.model_dump, sort_keys=True
+        )
+        return hashlib.sha1(records.encode()).hexdigest()
+
+    def load_state(self) -> DNSUpdateResult | None:
+        if self._state is None and (p := self.PATH_STATE_OUTPUT) and p.exists():
+            try:
+                self._state = DNSUpdateResult.model_validate_json(p.read_text())
+            except ValidationError:
+                self.logger.warning(f"ignoring invalid state file {p}")
+
+        return self._state
+
+    def save_state(self, res: DNSUpdateResult):
+        self._state = res
         if p := self.PATH_STATE_OUTPUT:
             p.parent.mkdir(parents=True, exist_ok=True)
             p.write_text(res.model_dump_json(indent=2))
 
-        return res
-
     @abstractmethod
-    def _run(self) -> DNSUpdateResult:
+    def _run(self, ip: str, ipv6: str | None) -> DNSUpdateResult:
         pass
 
     @staticmethod
-    @lru_cache
-    def get_public_ip() -> str | None:
-        try:
-            response = requests.get("https://api.ipify.org")
-            if response.status_code == 200:
-                return response.text
-        except requests.RequestException:
-            return None
+    def get_public_ips() -> tuple[str | None, str | None]:
+        from .ip import resolve_public_ips
+
+        return resolve_public_ips()
 
     @staticmethod
     def get_env_var(var: str):
-        try:
-            return os.environ[var]
-        except KeyError:
+        if not (value := os.environ.get(var)):
             raise RuntimeError(f"environment variable not found: {var}")
+        return value
@@ -1,23 +1,119 @@
+import json
 import logging
+from itertools import groupby
 from pathlib import Path
+from typing import Iterable, Iterator, Literal
 from urllib.parse import urljoin
 
 import requests
+from pydantic import BaseModel
 
 from .base import BaseDNSProvider, DNSUpdateResult
 
 BASE_URL = "https://api.cloudflare.com/client/v4/"
+# maximum page size of the dns_records listing
+RECORDS_PER_PAGE = 5000
+
+# errors of a batch caused by an outdated record index: unknown record ID,
+# or creation of a record that already exists
+STALE_INDEX_ERROR_CODES = {7003, 81044, 81053, 81057, 81058}
 
 logger = logging.getLogger(__name__)
 
 PATH_STATE_OUTPUT = (
     Path(__file__).absolute().parent.parent.joinpath("logs", "state_cloudflare.json")
 )
+PATH_RECORD_INDEX = (
+    Path(__file__).absolute().parent.parent.joinpath("logs", "records_cloudflare.json")
+)
+
+
+class CloudflareRecord(BaseModel):
+    zone_id: str
+    name: str
+    type: Literal["A", "AAAA"] = "A"
+    proxied: bool = True
+
+
+class RecordIndex:
+    """
+    Persistent mapping of (zone, type, name) to the last known state of Cloudflare records:
+    ID, content and proxied flag.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._records: dict[str, dict] | None = None
+
+    @staticmethod
+    def key(zone_id: str, name: str, type: str) -> str:
+        return f"{zone_id}/{type}/{name}"
+
+    @property
+    def records(self) -> dict[str, dict]:
+        if self._records is None:
+            try:
+                records = json.loads(self.path.read_text())
+            except (FileNotFoundError, json.JSONDecodeError):
+                records = {}
+            # older indexes only stored the record ID, their records are patched on the next update
+            self._records = {
+                k: (
+                    v
+                    if isinstance(v, dict)
+                    else {"id": v, "content": None, "proxied": None}
+                )
+                for k, v in records.items()
+            }
+
+        return self._records
+
+    def get(self, zone_id: str, name: str, type: str) -> dict | None:
+        return self.records.get(self.key(zone_id, name, type))
+
+    def update(self, zone_id: str, records: Iterable[dict]):
+        for record in records:
+            self.records[self.key(zone_id, record["name"], record["type"])] = {
+                "id": record["id"],
+                "content": record.get("content"),
+                "proxied": record.get("proxied"),
+            }
+        self.save()
+
+    def remove(self, zone_id: str, name: str, type: str):
+        self.records.pop(self.key(zone_id, name, type), None)
+
+    def invalidate(self, zone_id: str):
+        prefix = f"{zone_id}/"
+        for key in [k for k in self.records if k.startswith(prefix)]:
+            del self.records[key]
+        self.save()
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(self.records, indent=2))
+
+
+def is_stale_index_error(e: requests.HTTPError) -> bool:
+    if e.response is None:
+        return False
+    if e.response.status_code == 404:
+        return True
+
+    try:
+        errors = e.response.json().get("errors") or []
+    except ValueError:
+        return False
+    return any(error.get("code") in STALE_INDEX_ERROR_CODES for error in errors)
 
 
 class CloudFlareDNSProvider(BaseDNSProvider):
     name = "cloudflare"
 
+    def __init__(self):
+        super().__init__()
+        self.record_index = RecordIndex(PATH_RECORD_INDEX)
+
     def get_cloudflare_api_header(self):
         api_token = self.get_env_var("CLOUDFLARE_TOKEN")
 
@@ -32,17 +128,19 @@ class CloudFlareDNSProvider(BaseDNSProvider):
         method: str = "GET",
         data: dict = None,
         raise_error: bool = True,
+        params: dict = None,
     ) -> dict:
         def is_error_status(status: int):
             return not (200 <= status <= 229)
 
-        request_fun = getattr(requests, method.lower())
         url = urljoin(BASE_URL, endpoint)
-        logger.debug("sending", method, "request to", url)
-        response = request_fun(
+        logger.debug(f"sending {method} request to {url}")
+        response = self.session.request(
+            method,
             url,
             headers=self.get_cloudflare_api_header(),
             json=data,
+            params=params,
         )
         response_data = response.json()
         if raise_error and is_error_status(response.status_code):
@@ -60,41 +158,141 @@ class CloudFlareDNSProvider(BaseDNSProvider):
 
         # raise RuntimeError(f"domain {domain} does not exist")
 
-    def get_cloudflare_record_id(self, zone_id: str) -> str:
+    def get_records(self) -> list[CloudflareRecord]:
         """
-        Only update the root A record.
+        Records declared in the record set file, or the root A and AAAA records
+        from the environment variables.
         """
+        if (records := self.get_record_set()) is not None:
+            return [CloudflareRecord.model_validate(r) for r in records]
+
+        zone_id = self.get_cloudflare_zone_id()
         root_domain = self.get_env_var("CLOUDFLARE_ROOT_DOMAIN")
-        res = self.cloudflare_api_call(f"zones/{zone_id}/dns_records")
-        for record in res["result"]:
-            if record["name"] == root_domain:
-                return record["id"]
-
-        raise RuntimeError(f"record_id not found for root domain {root_domain}")
-
-    def overwrite_cloudflare_dns_record(
-        self, zone_id: str, record_id: str, ip: str, name: str, type: str, proxied: bool
-    ):
-        return self.cloudflare_api_call(
-            f"zones/{zone_id}/dns_records/{record_id}",
-            "PUT",
-            data={"content": ip, "name": name, "proxied": proxied, "type": type},
+        return [
+            CloudflareRecord(zone_id=zone_id, name=root_domain, type=type)
+            for type in ("A", "AAAA")
+        ]
+
+    def list_cloudflare_dns_records(self, zone_id: str, **filters) -> Iterator[dict]:
+        """List the DNS records of a zone matching the API filters, following pagination."""
+        page = 1
+        while True:
+            res = self.cloudflare_api_call(
+                f"zones/{zone_id}/dns_records",
+                params={**filters, "page": page, "per_page": RECORDS_PER_PAGE},
+            )
+            yield from res["result"]
+
+            total_pages = (res.get("result_info") or {}).get("total_pages", 1)
+            if page >= total_pages:
+                break
+            page += 1
+
+    def refresh_record_index(self, zone_id: str, records: list[CloudflareRecord]):
+        """
+        Read the live state of records into the index: a single record is looked up
+        with the API name/type filters, several records with a full listing of the zone.
+        """
+        if len(records) == 1:
+            record = records[0]
+            self.record_index.remove(zone_id, record.name, record.type)
+            filters = {"name": record.name, "type": record.type}
+        else:
+            logger.info(f"refreshing record index of zone {zone_id}")
+            self.record_index.invalidate(zone_id)
+            filters = {}
+
+        self.record_index.update(
+            zone_id, self.list_cloudflare_dns_records(zone_id, **filters)
         )
 
-    def _run(self) -> DNSUpdateResult:
-        ip = self.get_public_ip()
-        zone_id = self.get_cloudflare_zone_id()
-        record_id = self.get_cloudflare_record_id(zone_id)
-
-        res = self.overwrite_cloudflare_dns_record(
-            zone_id,
-            record_id,
-            ip,
-            self.get_env_var("CLOUDFLARE_ROOT_DOMAIN"),
-            type="A",
-            proxied=True,
+    def diff_records(
+        self, zone_id: str, records: list[CloudflareRecord], contents: dict[str, str]
+    ) -> dict[str, list[dict]]:
+        """Batch operations bringing the indexed records to the desired state."""
+        patches, posts = [], []
+        for record in records:
+            content = contents[record.type]
+            indexed = self.record_index.get(zone_id, record.name, record.type)
+            if indexed is None:
+                posts.append(
+                    {
+                        "name": record.name,
+                        "type": record.type,
+                        "content": content,
+                        "proxied": record.proxied,
+                    }
+                )
+            elif (indexed["content"], indexed["proxied"]) != (content, record.proxied):
+                patches.append(
+                    {"id": indexed["id"], "content": content, "proxied": record.proxied}
+                )
+
+        return {"patches": patches, "posts": posts}
+
+    def batch_update_cloudflare_dns_records(
+        self, zone_id: str, operations: dict[str, list[dict]]
+    ) -> dict:
+        res = self.cloudflare_api_call(
+            f"zones/{zone_id}/dns_records/batch", "POST", data=operations
         )
-        if "ip" not in res:
-            res["ip"] = ip
+        for records in res["result"].values():
+            self.record_index.update(zone_id, records)
+
+        return res
 
-        return DNSUpdateResult.model_validate(res)
+    def update_zone(
+        self,
+        zone_id: str,
+        records: list[CloudflareRecord],
+        contents: dict[str, str],
+        refresh: bool,
+    ) -> dict[str, list[dict]]:
+        """
+        Update the records of a zone that differ from the desired state, in one batch request.
+        The index is trusted unless a refresh is requested or the batch fails because of an outdated
+        index, in which case the live records are read and the batch is retried once.
+        """
+        missing = [
+            r for r in records if self.record_index.get(zone_id, r.name, r.type) is None
+        ]
+        if refresh or missing:
+            self.refresh_record_index(zone_id, missing if not refresh else records)
+
+        operations = self.diff_records(zone_id, records, contents)
+        if not any(operations.values()):
+            return operations
+
+        try:
+            self.batch_update_cloudflare_dns_records(zone_id, operations)
+        except requests.HTTPError as e:
+            # other errors (rate limiting, server errors) are not fixed by re-reading the records
+            if refresh or not is_stale_index_error(e):
+                raise
+            logger.warning(f"batch update of zone {zone_id} failed, refreshing index")
+            return self.update_zone(zone_id, records, contents, refresh=True)
+
+        return operations
+
+    def _run(self, ip: str, ipv6: str | None) -> DNSUpdateResult:
+        contents = {"A": ip, "AAAA": ipv6}
+        records = [r for r in self.get_records() if contents[r.type] is not None]
+        refresh = self.refresh_due(self.load_state())
+
+        result = {}
+        messages = []
+        for zone_id, zone_records in groupby(
+            sorted(records, key=lambda r: r.zone_id), key=lambda r: r.zone_id
+        ):
+            operations = self.update_zone(
+                zone_id, list(zone_records), contents, refresh
+            )
+            result[zone_id] = operations
+            messages.append(
+                f"zone {zone_id}: {len(operations['patches'])} updated, "
+                f"{len(operations['posts'])} created"
+            )
+
+        return DNSUpdateResult(
+            ip=ip, ipv6=ipv6, success=True, messages=messages, result=result
+        )
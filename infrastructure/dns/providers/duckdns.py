@@ -1,5 +1,3 @@
-import requests
-
 from .base import BaseDNSProvider, DNSUpdateResult
 
 BASE_URL = "https://www.duckdns.org/update"
@@ -8,18 +6,43 @@ BASE_URL = "https://www.duckdns.org/update"
 class DuckDNSProvider(BaseDNSProvider):
     name = "duckdns"
 
-    def _run(self) -> DNSUpdateResult:
+    def get_records(self) -> list[str]:
+        """Domains declared in the record set file, or the comma-separated `DUCKDNS_DOMAIN`."""
+        if (domains := self.get_record_set()) is not None:
+            return domains
+
+        return [d.strip() for d in self.get_env_var("DUCKDNS_DOMAIN").split(",")]
+
+    def get_changed_domains(self, ip: str, ipv6: str | None) -> list[str]:
+        """
+        Domains that must be written: all of them if the IPs changed or a refresh is due,
+        otherwise only the ones that were not written by the last run.
+        """
+        domains = self.get_records()
+        previous = self.load_state()
+        if self.refresh_due(previous) or (previous.ip, previous.ipv6) != (ip, ipv6):
+            return domains
+
+        written = set((previous.result or {}).get("domains", []))
+        return [d for d in domains if d not in written]
+
+    def _run(self, ip: str, ipv6: str | None) -> DNSUpdateResult:
         token = self.get_env_var("DUCKDNS_TOKEN")
-        domain = self.get_env_var("DUCKDNS_DOMAIN")
-        ip = self.get_public_ip()
+        domains = self.get_changed_domains(ip, ipv6)
+        result = {"domains": self.get_records()}
+        if not domains:
+            return DNSUpdateResult(ip=ip, ipv6=ipv6, result=result)
 
+        # all domains are updated with a single request
         params = {
-            "domains": domain,
+            "domains": ",".join(domains),
             "token": token,
             "ip": ip,
         }
+        if ipv6 is not None:
+            params["ipv6"] = ipv6
 
-        response = requests.get(BASE_URL, params=params)
+        response = self.session.get(BASE_URL, params=params)
         response.raise_for_status()
 
         message = response.text
@@ -28,6 +51,8 @@ class DuckDNSProvider(BaseDNSProvider):
 
         return DNSUpdateResult(
             ip=ip,
+            ipv6=ipv6,
             messages=messages,
             errors=errors,
+            result=result,
         )
@@ -0,0 +1,142 @@
+import ipaddress
+import logging
+import os
+import socket
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+
+import requests
+
+from .base import get_http_session
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOURCES = {
+    4: "https://api.ipify.org,https://ipv4.icanhazip.com,https://v4.ident.me",
+    6: "https://api6.ipify.org,https://ipv6.icanhazip.com,https://v6.ident.me",
+}
+# well-known public resolvers, only used to select the outgoing interface (no packet is sent)
+PROBE_ADDRESSES = {4: "1.1.1.1", 6: "2606:4700:4700::1111"}
+
+# lookups run in the background, slow sources don't delay the answer of the fastest ones
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="public-ip")
+_executor_v6 = ThreadPoolExecutor(max_workers=1, thread_name_prefix="public-ipv6")
+
+
+def parse_ip(text: str, version: int) -> str | None:
+    try:
+        ip = ipaddress.ip_address(text.strip())
+    except ValueError:
+        return None
+
+    return str(ip) if ip.version == version else None
+
+
+class PublicIPResolver:
+    """
+    Resolve the public IP address of a given version by querying several sources at once.
+    The first address reported by `quorum` sources wins and is cached for `ttl` seconds.
+    If the outgoing interface has a global address (typically IPv6), it is used without any request.
+    """
+
+    def __init__(
+        self,
+        version: int,
+        sources: list[str],
+        quorum: int,
+        ttl: float,
+        local_lookup: bool = True,
+    ):
+        self.version = version
+        self.sources = sources
+        self.quorum = min(quorum, len(sources))
+        self.ttl = ttl
+        self.local_lookup = local_lookup
+
+        self._lock = threading.Lock()
+        self._cached: str | None = None
+        self._expires = 0.0
+
+    def resolve(self) -> str | None:
+        with self._lock:
+            if self._cached is not None and time.monotonic() < self._expires:
+                return self._cached
+
+            ip = self.resolve_local() if self.local_lookup else None
+            ip = ip or self.resolve_remote()
+            if ip is not None:
+                self._cached = ip
+                self._expires = time.monotonic() + self.ttl
+
+            return ip
+
+    def resolve_local(self) -> str | None:
+        """Address of the interface used to reach the internet, if it is globally routable."""
+        family = socket.AF_INET if self.version == 4 else socket.AF_INET6
+        try:
+            with socket.socket(family, socket.SOCK_DGRAM) as sock:
+                sock.connect((PROBE_ADDRESSES[self.version], 53))
+                ip = ipaddress.ip_address(sock.getsockname()[0])
+        except OSError:
+            return None
+
+        if ip.is_global:
+            logger.debug(f"using address of local interface: {ip}")
+            return str(ip)
+
+        return None
+
+    def query_source(self, url: str) -> str | None:
+        try:
+            response = get_http_session().get(url)
+            if response.status_code == 200:
+                return parse_ip(response.content.decode(errors="replace"), self.version)
+        except requests.RequestException as e:
+            logger.warning(f"public IP source {url} failed: {e}")
+
+        return None
+
+    def resolve_remote(self) -> str | None:
+        pending = {_executor.submit(self.query_source, url) for url in self.sources}
+        votes = Counter()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if (ip := future.result()) is None:
+                    continue
+                votes[ip] += 1
+                if votes[ip] >= self.quorum:
+                    return ip
+
+        logger.error(
+            f"no IPv{self.version} address confirmed by {self.quorum} sources, got {dict(votes)}"
+        )
+        return None
+
+
+@lru_cache
+def get_resolver(version: int) -> PublicIPResolver:
+    sources = os.environ.get(f"DNS_IP_SOURCES_V{version}", DEFAULT_SOURCES[version])
+    return PublicIPResolver(
+        version,
+        sources=[s.strip() for s in sources.split(",") if s.strip()],
+        quorum=int(os.environ.get("DNS_IP_QUORUM", 2)),
+        ttl=float(os.environ.get("DNS_IP_CACHE_TTL", 60)),
+        local_lookup=os.environ.get("DNS_IP_LOCAL_LOOKUP", "true").lower() == "true",
+    )
+
+
+def ipv6_enabled() -> bool:
+    return os.environ.get("DNS_ENABLE_IPV6", "false").lower() == "true"
+
+
+def resolve_public_ips() -> tuple[str | None, str | None]:
+    """Resolve the public IPv4 and, if enabled, IPv6 addresses concurrently."""
+    if not ipv6_enabled():
+        return get_resolver(4).resolve(), None
+
+    future_v6 = _executor_v6.submit(get_resolver(6).resolve)
+    return get_resolver(4).resolve(), future_v6.result()
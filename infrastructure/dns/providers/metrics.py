@@ -0,0 +1,43 @@
+from urllib.parse import urlparse
+
+import requests
+from prometheus_client import Counter, Gauge, Histogram
+
+RUN_DURATION = Histogram(
+    "dns_provider_run_duration_seconds",
+    "Duration of DNS provider runs",
+    ["provider"],
+)
+API_CALL_DURATION = Histogram(
+    "dns_api_call_duration_seconds",
+    "Latency of HTTP calls to DNS providers and public IP sources",
+    ["host", "method", "status"],
+)
+API_RETRIES = Counter(
+    "dns_api_retries_total",
+    "Number of retried HTTP calls",
+    ["host"],
+)
+UPDATES = Counter(
+    "dns_updates_total",
+    "Number of DNS provider runs, by outcome (written, skipped, failed)",
+    ["provider", "outcome"],
+)
+LAST_SUCCESS = Gauge(
+    "dns_last_success_timestamp_seconds",
+    "Time of the last successful DNS provider run",
+    ["provider"],
+)
+LAST_IP_CHANGE = Gauge(
+    "dns_last_ip_change_timestamp_seconds",
+    "Time at which a change of the public IP was last detected",
+)
+
+
+def observe_response(response: requests.Response, *args, **kwargs):
+    """`requests` response hook recording the latency of API calls."""
+    API_CALL_DURATION.labels(
+        host=urlparse(response.url).hostname,
+        method=response.request.method,
+        status=response.status_code,
+    ).observe(response.elapsed.total_seconds())
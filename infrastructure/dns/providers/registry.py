@@ -0,0 +1,80 @@
+import importlib
+import logging
+import os
+from dataclasses import dataclass
+from importlib.metadata import entry_points
+
+from .base import BaseDNSProvider
+
+logger = logging.getLogger(__name__)
+
+# third-party providers register a `name = "package.module:ProviderClass"` entry point in this group
+ENTRY_POINT_GROUP = "home_server.dns_providers"
+
+
+@dataclass(frozen=True)
+class ProviderSpec:
+    """Reference to a provider class, imported only when the provider is used."""
+
+    name: str
+    # "module:Class", relative modules are resolved within this package
+    target: str
+    # environment variables that must be set for the provider to be configured
+    required_env: tuple[str, ...] = ()
+
+    @property
+    def is_configured(self) -> bool:
+        # docker compose passes unset variables as empty strings
+        return all(os.environ.get(var) for var in self.required_env)
+
+    def load(self) -> type[BaseDNSProvider]:
+        module, cls = self.target.split(":")
+        return getattr(importlib.import_module(module, package=__package__), cls)
+
+
+BUILTIN_PROVIDERS = (
+    ProviderSpec(
+        "cloudflare",
+        ".cloudflare:CloudFlareDNSProvider",
+        ("CLOUDFLARE_TOKEN", "CLOUDFLARE_ZONE_ID", "CLOUDFLARE_ROOT_DOMAIN"),
+    ),
+    ProviderSpec(
+        "duckdns", ".duckdns:DuckDNSProvider", ("DUCKDNS_TOKEN", "DUCKDNS_DOMAIN")
+    ),
+)
+
+
+def discover_providers() -> dict[str, ProviderSpec]:
+    """Built-in providers and providers registered through entry points, without importing them."""
+    specs = {spec.name: spec for spec in BUILTIN_PROVIDERS}
+    for ep in entry_points(group=ENTRY_POINT_GROUP):
+        specs[ep.name] = ProviderSpec(ep.name, ep.value)
+
+    return specs
+
+
+def get_enabled_providers() -> list[ProviderSpec]:
+    """
+    Providers listed in `DNS_PROVIDERS` (comma-separated),
+    or all configured providers if the variable is not set.
+    """
+    specs = discover_providers()
+    if (names := os.environ.get("DNS_PROVIDERS")) is None:
+        return [spec for spec in specs.values() if spec.is_configured]
+
+    enabled = []
+    for name in filter(None, (n.strip() for n in names.split(","))):
+        if name not in specs:
+            raise RuntimeError(f"unknown DNS provider: {name}")
+        enabled.append(specs[name])
+
+    return enabled
+
+
+def load_providers(specs: list[ProviderSpec]) -> list[BaseDNSProvider]:
+    providers = []
+    for spec in specs:
+        logger.info(f"loading DNS provider {spec.name}")
+        providers.append(spec.load()())
+
+    return providers
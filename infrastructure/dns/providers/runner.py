@@ -0,0 +1,88 @@
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from . import metrics
+from .base import BaseDNSProvider, DNSUpdateResult
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderRunner:
+    """
+    Run DNS providers concurrently: the public IPs are resolved once per run and handed to every provider,
+    so that the wall time of a run is the one of the slowest provider.
+    """
+
+    def __init__(self, providers: list[BaseDNSProvider], timeout: float):
+        self.providers = providers
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(len(providers), 1), thread_name_prefix="dns-provider"
+        )
+        # providers whose run exceeded the timeout and is still ongoing
+        self._pending: dict[str, Future] = {}
+        # last resolved public IPs (IPv4, IPv6), seeded from the saved states on the first run
+        self._last_ips: tuple[str | None, str | None] | None = None
+
+    def saved_ips(self) -> tuple[str | None, str | None]:
+        for provider in self.providers:
+            if (state := provider.load_state()) is not None and state.ip is not None:
+                return state.ip, state.ipv6
+        return None, None
+
+    def detect_ip_change(self, ip: str | None, ipv6: str | None):
+        """
+        Record a change of the public IPs in the metrics, once per run. An IP that could not be resolved
+        is not a change, the last resolved one is kept for the next comparison.
+        """
+        if self._last_ips is None:
+            self._last_ips = self.saved_ips()
+
+        ips = (ip, ipv6)
+        if any(
+            old is not None and new is not None and old != new
+            for old, new in zip(self._last_ips, ips)
+        ):
+            metrics.LAST_IP_CHANGE.set_to_current_time()
+        self._last_ips = tuple(
+            new if new is not None else old for old, new in zip(self._last_ips, ips)
+        )
+
+    def run(self) -> dict[str, DNSUpdateResult]:
+        ip, ipv6 = BaseDNSProvider.get_public_ips()
+        self.detect_ip_change(ip, ipv6)
+
+        futures: dict[str, Future] = {}
+        for provider in self.providers:
+            if (future := self._pending.get(provider.name)) and not future.done():
+                logger.warning(
+                    f"previous run of {provider.name} still ongoing, skipping"
+                )
+                continue
+            futures[provider.name] = self._executor.submit(
+                provider.run, ip, ipv6, resolved=True
+            )
+
+        wait(futures.values(), timeout=self.timeout)
+
+        results = {}
+        for provider in self.providers:
+            if (future := futures.get(provider.name)) is None:
+                continue
+
+            if future.done():
+                self._pending.pop(provider.name, None)
+                results[provider.name] = future.result()
+            else:
+                logger.error(f"{provider.name} did not finish within {self.timeout}s")
+                self._pending[provider.name] = future
+                res = provider.error_result(
+                    ip, TimeoutError(f"provider run exceeded {self.timeout}s"), ipv6
+                )
+                provider.save_state(res)
+                results[provider.name] = res
+
+        return results
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,95 @@
+"""
+Headless generation of the invoices of the `invoices` sheet: the LaTeX variables of each invoice are written
+to `<output>/<invoice_id>.tex`, from the hours of its period.
+
+    python cli.py --sheet <data sheet url> --hours export.csv --output invoices
+"""
+
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+import pipeline
+from sheets import SheetCache, craft_google_sheet_url
+
+logger = logging.getLogger(__name__)
+
+# days of the hours export, set once per worker process
+_df_days: pd.DataFrame = None
+
+
+def init_worker(df_days: pd.DataFrame):
+    global _df_days
+    _df_days = df_days
+
+
+def write_invoice(invoice_id: str, invoice_row: pd.Series, output: Path) -> Path:
+    path = output / f"{invoice_id}.tex"
+    path.write_text(pipeline.generate_invoice(_df_days, invoice_id, invoice_row))
+    return path
+
+
+def generate_invoices(
+    invoices: pd.DataFrame, df_days: pd.DataFrame, output: Path, workers: int | None
+) -> list[Path]:
+    output.mkdir(parents=True, exist_ok=True)
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker, initargs=(df_days,)
+    ) as executor:
+        futures = {
+            invoice_id: executor.submit(write_invoice, invoice_id, row, output)
+            for invoice_id, row in invoices.iterrows()
+        }
+        paths = []
+        for invoice_id, future in futures.items():
+            paths.append(future.result())
+            logger.info(f"invoice {invoice_id} written to {paths[-1]}")
+
+    return paths
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Generate the LaTeX variables of the invoices."
+    )
+    parser.add_argument("--sheet", required=True, help="data sheet URL or file")
+    parser.add_argument("--hours", required=True, help="time tracking CSV export")
+    parser.add_argument(
+        "--output", type=Path, default=Path("invoices"), help="output directory"
+    )
+    parser.add_argument(
+        "--invoice",
+        action="append",
+        help="invoice ID to generate, can be repeated (default: all invoices)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="worker processes (default: CPUs)"
+    )
+    parser.add_argument(
+        "--reload", action="store_true", help="revalidate the cached data sheet"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    data = SheetCache(craft_google_sheet_url(args.sheet)).load(force=args.reload)
+    invoices = data["invoices"].set_index("invoice_id")
+    assert invoices.index.is_unique
+    if args.invoice:
+        invoices = invoices[invoices.index.astype(str).isin(args.invoice)]
+
+    # only the sessions of the invoiced periods are loaded
+    df_hours = pipeline.read_hours(
+        args.hours,
+        start=invoices.INVOICE_START_DATE.min(),
+        end=invoices.INVOICE_END_DATE.max(),
+    )
+    df_days = pipeline.split_by_day(df_hours)
+    df_days["dt"] = df_days.end_date - df_days.start_date
+
+    generate_invoices(invoices, df_days, args.output, args.workers)
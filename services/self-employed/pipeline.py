@@ -0,0 +1,222 @@
+import logging
+import re
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+logger = logging.getLogger(__name__)
+
+HOURS_COLUMNS = ["project", "client", "task", "tags", "start_date", "end_date"]
+CATEGORY_COLUMNS = ["project", "client", "task", "tags"]
+# columns read from the time tracking export, after normalization of their names
+EXPORT_COLUMNS = [
+    *CATEGORY_COLUMNS,
+    "start_date",
+    "start_time",
+    "end_date",
+    "end_time",
+    "duration_h",
+]
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+CHUNK_SIZE = 100_000
+
+
+def normalize_column(name: str) -> str:
+    return re.sub(r"\((.+)\)", r"\1", name.lower()).replace(" ", "_")
+
+
+def process_columns(df: pd.DataFrame) -> pd.DataFrame:
+    df.columns = [normalize_column(c) for c in df.columns]
+    return df
+
+
+def to_datetime(date: pd.Series, time: pd.Series) -> pd.Series:
+    text = date + " " + time
+    try:
+        return pd.to_datetime(text, format=DATETIME_FORMAT)
+    except ValueError:
+        logger.warning(f"datetimes not in format {DATETIME_FORMAT}, inferring it")
+        return pd.to_datetime(text)
+
+
+def processing_time(df: pd.DataFrame) -> pd.DataFrame:
+    for x in ("start", "end"):
+        df[f"{x}_date"] = to_datetime(df[f"{x}_date"], df.pop(f"{x}_time"))
+
+    df["duration_h"] = pd.to_timedelta(df["duration_h"])
+    mask = df.duration_h == df.end_date - df.start_date
+    assert mask.all()
+    df.drop(columns="duration_h", inplace=True)
+    return df
+
+
+def read_hours(
+    source,
+    start: pd.Timestamp | None = None,
+    end: pd.Timestamp | None = None,
+    chunksize: int = CHUNK_SIZE,
+) -> pd.DataFrame:
+    """
+    Read the sessions of a time tracking export (path or file object) in chunks, keeping only the needed
+    columns and, if given, the sessions overlapping the days from `start` to `end`, so that the memory used
+    depends on the selected sessions rather than on the size of the export.
+    """
+    columns = pd.read_csv(source, nrows=0).columns
+    if hasattr(source, "seek"):
+        source.seek(0)
+    names = {c: normalize_column(c) for c in columns}
+    dtypes = {
+        c: "category" if name in CATEGORY_COLUMNS else str
+        for c, name in names.items()
+        if name in EXPORT_COLUMNS
+    }
+
+    chunks = []
+    for chunk in pd.read_csv(
+        source, usecols=list(dtypes), dtype=dtypes, chunksize=chunksize
+    ):
+        chunk = processing_time(process_columns(chunk))
+        # the categories of a column without values in the chunk have no defined type
+        for column in CATEGORY_COLUMNS:
+            categories = chunk[column].cat.categories
+            chunk[column] = chunk[column].cat.set_categories(categories.astype(str))
+        if start is not None:
+            chunk = chunk[chunk.end_date >= start.normalize()]
+        if end is not None:
+            chunk = chunk[chunk.start_date < end.normalize() + pd.Timedelta(days=1)]
+        chunks.append(chunk[HOURS_COLUMNS])
+
+    if not chunks:
+        return pd.DataFrame(columns=HOURS_COLUMNS)
+
+    # chunks have their own categories, unified before the concatenation
+    categories = {
+        column: pd.CategoricalDtype(
+            union_categoricals(
+                [c[column] for c in chunks], sort_categories=True
+            ).categories
+        )
+        for column in CATEGORY_COLUMNS
+    }
+    return pd.concat([c.astype(categories) for c in chunks], ignore_index=True)
+
+
+# end of the pieces of a session ending after their day
+END_OF_DAY = pd.Timedelta(hours=23, minutes=59, seconds=59)
+
+
+def split_by_day(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Split the sessions spanning several days into one row per day, most recent first.
+
+    The first piece keeps the start of the session and the last one its end. In between, pieces
+    run from 00:00:00 to 23:59:59 plus the sub-second part of the session start.
+    """
+    start = df["start_date"]
+    end = df["end_date"]
+    first_day = start.dt.normalize()
+    n_days = (end.dt.normalize() - first_day).dt.days.clip(lower=0).to_numpy()
+    fraction = (start - start.dt.floor("s")).to_numpy()
+
+    # one row per day of each session, in the order of the sessions
+    positions = np.repeat(np.arange(len(df)), n_days + 1)
+    offsets = np.cumsum(n_days + 1) - (n_days + 1)
+    k = np.arange(len(positions)) - offsets[positions]
+    last = n_days[positions]
+    day = first_day.to_numpy()[positions] + k * np.timedelta64(1, "D")
+
+    days = df.iloc[positions].copy()
+    days["start_date"] = np.where(
+        k == 0, start.to_numpy()[positions], day + fraction[positions]
+    )
+    days["end_date"] = np.where(
+        k == last,
+        end.to_numpy()[positions],
+        day + END_OF_DAY.to_timedelta64() + fraction[positions],
+    )
+    return days.sort_values("start_date", ascending=False)
+
+
+def aggregate_days(df_days: pd.DataFrame) -> pd.DataFrame:
+    """Worked time per day and task."""
+    return (
+        df_days.groupby([df_days.start_date.dt.date, "task"], observed=True)
+        .dt.sum()
+        .reset_index()
+    )
+
+
+def select_period(
+    df_days: pd.DataFrame, start: pd.Timestamp, end: pd.Timestamp
+) -> pd.DataFrame:
+    """Days of sessions from the `start` day to the `end` day, inclusive."""
+    day = df_days.start_date.dt.normalize()
+    return df_days[(day >= start.normalize()) & (day <= end.normalize())]
+
+
+def to_latex(df: pd.DataFrame) -> str:
+    ltx = df.style.format(decimal=".", precision=3, thousands="'").to_latex(
+        hrules=True, environment="longtable", siunitx=True
+    )
+    ltx = re.sub(r"& \{([^}]*)\}", r"& \\textbf{\g<1>}", ltx)
+    return ltx
+
+
+def build_invoice(
+    df_agg: pd.DataFrame, invoice_id: str, invoice_row: pd.Series
+) -> tuple[pd.DataFrame, dict[str, str]]:
+    """Invoice table and LaTeX variables of an invoice, from the aggregated hours."""
+    df_agg = df_agg.copy()
+    df_agg["hours"] = (df_agg.pop("dt").dt.total_seconds() / 3600).round(3)
+    df_agg["task"] = df_agg.task.str.capitalize()
+    df_agg["rate"] = invoice_row.HOURLY_RATE
+    df_agg["total"] = df_agg.rate * df_agg.hours
+
+    total = df_agg.total.sum()
+    total_hours = df_agg.hours.sum()
+
+    df_agg.rename(
+        columns={
+            "start_date": "Date",
+            "task": "Tâche",
+            "hours": "Heures",
+            "rate": f"Taux ({invoice_row.DEVISE})",
+            "total": f"Total ({invoice_row.DEVISE})",
+        },
+        inplace=True,
+    )
+
+    period = " - ".join(
+        d.strftime("%Y/%m/%d")
+        for d in (invoice_row.INVOICE_START_DATE, invoice_row.INVOICE_END_DATE)
+    )
+    mapping = {
+        "numeroFacture": invoice_id,
+        "periodeFacturee": period,
+        "tauxHoraire": str(invoice_row.HOURLY_RATE),
+        "totalAPayer": str(total),
+        "totalHeures": str(total_hours),
+        "devise": invoice_row.DEVISE,
+        "detailHeuresTravaillees": to_latex(df_agg),
+    }
+    return df_agg, mapping
+
+
+def to_command(k: str, v: str) -> str:
+    return "\\newcommand{\\" + k + "}{" + v + "}"
+
+
+def to_variables(mapping: dict[str, str]) -> str:
+    return "\n\n".join(to_command(k, v) for k, v in mapping.items())
+
+
+def generate_invoice(
+    df_days: pd.DataFrame, invoice_id: str, invoice_row: pd.Series
+) -> str:
+    """LaTeX variables of an invoice, from the days of its period."""
+    df_days = select_period(
+        df_days, invoice_row.INVOICE_START_DATE, invoice_row.INVOICE_END_DATE
+    )
+    _, mapping = build_invoice(aggregate_days(df_days), invoice_id, invoice_row)
+    return to_variables(mapping)
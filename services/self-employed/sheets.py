@@ -0,0 +1,185 @@
+"""
+Disk cache of the data workbook: each sheet is stored as a Parquet file, in a directory keyed by the workbook URL.
+
+The cached sheets are used for `ttl` seconds, after which the workbook is revalidated with a conditional request
+(ETag / Last-Modified), or with the modification time of a local file. Only the sheets whose content changed are
+written again.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from urllib.parse import urlencode, urlparse, urlunparse
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.environ.get("INVOICE_CACHE_DIR", Path(__file__).parent / "cache"))
+CACHE_TTL = float(os.environ.get("INVOICE_CACHE_TTL", 3600))
+
+
+def craft_google_sheet_url(url: str, export_format="xlsx") -> str:
+    parsed = urlparse(url)
+    if "docs.google.com" not in parsed.netloc or "/spreadsheets" not in parsed.path:
+        return url
+
+    path = parsed.path.rstrip("/").replace("/edit", "/export")
+    if not path.endswith("/export"):
+        path = path + "/export"
+
+    query_params = {"format": export_format}
+    new_query = urlencode(query_params)
+
+    new_url = urlunparse(parsed._replace(path=path, query=new_query))
+    return new_url
+
+
+def hash_frame(df: pd.DataFrame) -> str:
+    content = pd.util.hash_pandas_object(df.astype(str), index=True).to_numpy()
+    columns = json.dumps([str(c) for c in df.columns])
+    return hashlib.sha256(content.tobytes() + columns.encode()).hexdigest()
+
+
+class SheetCache:
+    def __init__(self, url: str, cache_dir: Path = CACHE_DIR, ttl: float = CACHE_TTL):
+        self.url = url
+        self.ttl = ttl
+        self.path = cache_dir / hashlib.sha256(url.encode()).hexdigest()[:16]
+        self.path_meta = self.path / "meta.json"
+
+    @property
+    def local_path(self) -> Path | None:
+        parsed = urlparse(self.url)
+        if parsed.scheme in ("", "file"):
+            return Path(parsed.path)
+        return None
+
+    def read_meta(self) -> dict:
+        try:
+            return json.loads(self.path_meta.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def write_meta(self, meta: dict):
+        tmp = self.path_meta.with_suffix(".tmp")
+        tmp.write_text(json.dumps(meta, indent=2))
+        tmp.replace(self.path_meta)
+
+    def sheet_file(self, meta: dict, sheet: str) -> Path:
+        return self.path / meta["files"][sheet]
+
+    def read_sheet(self, meta: dict, sheet: str) -> pd.DataFrame:
+        file = self.sheet_file(meta, sheet)
+        if file.suffix == ".parquet":
+            return pd.read_parquet(file)
+        return pd.read_pickle(file)
+
+    def write_sheet(self, meta: dict, sheet: str, df: pd.DataFrame):
+        name = hashlib.sha256(sheet.encode()).hexdigest()[:16]
+        file = self.path / f"{name}.parquet"
+        try:
+            df.to_parquet(file.with_suffix(".tmp"))
+        except (ValueError, TypeError, NotImplementedError) as e:
+            # e.g. columns mixing types, that have no Arrow equivalent
+            logger.warning(
+                f"sheet {sheet} is not storable as Parquet ({e}), pickling it"
+            )
+            file = file.with_suffix(".pkl")
+            df.to_pickle(file.with_suffix(".tmp"))
+        file.with_suffix(".tmp").replace(file)
+        if (previous := meta["files"].get(sheet)) not in (None, file.name):
+            (self.path / previous).unlink(missing_ok=True)
+        meta["files"][sheet] = file.name
+
+    def fetch(self, meta: dict) -> tuple[bytes | None, dict]:
+        """
+        Download the workbook if it changed since the cached version,
+        return its content (None if unchanged) and its validators.
+        """
+        if (path := self.local_path) is not None:
+            stat = path.stat()
+            validators = {"mtime": stat.st_mtime_ns, "size": stat.st_size}
+            if validators == meta.get("validators"):
+                return None, validators
+            return path.read_bytes(), validators
+
+        request = urllib.request.Request(self.url)
+        validators = meta.get("validators") or {}
+        if etag := validators.get("etag"):
+            request.add_header("If-None-Match", etag)
+        if last_modified := validators.get("last_modified"):
+            request.add_header("If-Modified-Since", last_modified)
+
+        try:
+            with urllib.request.urlopen(request) as response:
+                content = response.read()
+                headers = response.headers
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and meta.get("files"):
+                return None, validators
+            raise
+
+        validators = {
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+        }
+        return content, validators
+
+    def is_fresh(self, meta: dict) -> bool:
+        return bool(meta.get("files")) and time.time() - meta["checked_at"] < self.ttl
+
+    def refresh(
+        self, sheets: list[str] | None = None, meta: dict | None = None
+    ) -> dict:
+        """
+        Revalidate the workbook and store the sheets that changed, `sheets` restricts
+        the refresh to some sheets. Return the cache metadata.
+        """
+        meta = meta if meta is not None else self.read_meta()
+        content, validators = self.fetch(meta)
+        if content is None:
+            logger.info(f"workbook {self.url} unchanged")
+        else:
+            self.path.mkdir(parents=True, exist_ok=True)
+            meta.setdefault("files", {})
+            meta.setdefault("hashes", {})
+
+            xls = pd.ExcelFile(io.BytesIO(content))
+            for sheet in xls.sheet_names if sheets is None else sheets:
+                df = pd.read_excel(xls, sheet_name=sheet)
+                if (digest := hash_frame(df)) == meta["hashes"].get(sheet):
+                    continue
+                logger.info(f"storing sheet {sheet} of workbook {self.url}")
+                self.write_sheet(meta, sheet, df)
+                meta["hashes"][sheet] = digest
+
+            if sheets is None:
+                # drop sheets removed from the workbook
+                for sheet in set(meta["files"]) - set(xls.sheet_names):
+                    self.sheet_file(meta, sheet).unlink(missing_ok=True)
+                    del meta["files"][sheet]
+                    del meta["hashes"][sheet]
+                meta["sheets"] = xls.sheet_names
+            else:
+                meta.setdefault("sheets", list(meta["files"]))
+                # a partial refresh leaves the other sheets to be revalidated
+                validators = {}
+
+        meta.update(url=self.url, validators=validators, checked_at=time.time())
+        self.write_meta(meta)
+        return meta
+
+    def load(self, force: bool = False) -> dict[str, pd.DataFrame]:
+        """Sheets of the workbook, revalidated if the cache is older than the TTL or `force` is set."""
+        meta = self.read_meta()
+        if force or not self.is_fresh(meta):
+            meta = self.refresh(meta=meta)
+
+        return {sheet: self.read_sheet(meta, sheet) for sheet in meta["sheets"]}
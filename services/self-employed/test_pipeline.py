@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+from pipeline import split_by_day
+
+
+def process_rows(df):
+    """Previous row by row implementation of `split_by_day`, kept as reference."""
+
+    def expand_row(row):
+        if row.end_date.date() == row.start_date.date():
+            return [row]
+        row1 = row.copy()
+        row1.end_date = row1.start_date.replace(hour=23, minute=59, second=59)
+        row2 = row.copy()
+        row2.start_date = (row.start_date + pd.Timedelta("1 day")).replace(
+            hour=0, minute=0, second=0
+        )
+        return [row1] + expand_row(row2)
+
+    rows = []
+    for _, row in df.iterrows():
+        rows.extend(expand_row(row))
+    return pd.DataFrame(rows).sort_values("start_date", ascending=False)
+
+
+def make_sessions(starts: list[str], ends: list[str]) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "task": [f"task {i % 3}" for i in range(len(starts))],
+            "start_date": pd.to_datetime(starts, format="ISO8601"),
+            "end_date": pd.to_datetime(ends, format="ISO8601"),
+        }
+    )
+
+
+def assert_same_split(df: pd.DataFrame):
+    assert_frame_equal(split_by_day(df), process_rows(df))
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_random_sessions(seed):
+    rng = np.random.default_rng(seed)
+    n = 1000
+    start = pd.Timestamp("2024-01-01") + pd.to_timedelta(
+        rng.integers(0, 90 * 86400, n), unit="s"
+    )
+    # mostly short sessions, some spanning several days
+    duration = pd.to_timedelta(rng.exponential(4 * 3600, n).astype(int), unit="s")
+    df = pd.DataFrame(
+        {
+            "task": rng.choice(["dev", "review", "meeting"], n),
+            "start_date": start,
+            "end_date": start + duration,
+        },
+        # duplicated labels, as in concatenated exports
+        index=np.arange(n) % 100,
+    )
+    assert_same_split(df)
+
+
+def test_end_at_midnight():
+    assert_same_split(make_sessions(["2024-03-01 22:00:00"], ["2024-03-02 00:00:00"]))
+
+
+def test_subsecond_start():
+    assert_same_split(
+        make_sessions(
+            ["2024-03-01 22:00:00.250", "2024-03-01 23:59:59.500"],
+            ["2024-03-04 01:00:00", "2024-03-02 00:00:00.200"],
+        )
+    )
+
+
+def test_zero_length_session():
+    assert_same_split(make_sessions(["2024-03-01 10:00:00"], ["2024-03-01 10:00:00"]))
+
+
+def test_same_day_session_is_unchanged():
+    df = make_sessions(["2024-03-01 08:00:00"], ["2024-03-01 17:30:00"])
+    assert_frame_equal(split_by_day(df), df)
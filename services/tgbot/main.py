@@ -4,45 +4,51 @@ import signal
 from common.config import setup
 
 setup(__file__)
-from src.bot import run_bot  # noqa: E402
+from src.bot import TelegramBot, run_bot  # noqa: E402
+from src.message_queue import create_message_queue  # noqa: E402
 from src.rest_api import run_flask_app  # noqa: E402
+from src.settings import Settings  # noqa: E402
 
-message_queue = asyncio.Queue()
+settings = Settings.load()
+message_queue = create_message_queue(settings.queue)
 
 
-async def main():
-    # Starting both the Flask (Quart) app and Telegram bot as tasks
-    server_task = asyncio.create_task(run_flask_app(message_queue))
-    bot_task = asyncio.create_task(run_bot(message_queue))
-
-    # Wait for the tasks to finish (they won't unless cancelled)
-    await asyncio.wait([server_task, bot_task], return_when=asyncio.FIRST_COMPLETED)
+def request_shutdown(sig: signal.Signals, stop: asyncio.Event):
+    print(f"Received exit signal {sig.name}...")
+    stop.set()
 
 
-async def graceful_shutdown(signal, tasks):
-    print(f"Received exit signal {signal.name}...")
-    for task in tasks:
-        task.cancel()
-    print("Cancelled all tasks, exiting...")
-    # Optionally, you can add more cleanup code here if needed
-
+async def main():
+    bot = TelegramBot()
+    # in webhook mode, updates are received by the API server
+    webhook_bot = bot if settings.webhook.enabled else None
 
-async def async_main():
+    # set on SIGINT / SIGTERM, the API server stops accepting requests, then the bot is cancelled
+    stop = asyncio.Event()
     loop = asyncio.get_running_loop()
-
-    # Prepare tasks for the main application logic
-    tasks = asyncio.all_tasks(loop)
-    # Exclude this main() task itself to prevent it from being cancelled prematurely
-    tasks.remove(asyncio.current_task(loop))
-
-    # Register signal handlers to ensure graceful shutdown
     for sig in (signal.SIGINT, signal.SIGTERM):
-        loop.add_signal_handler(
-            sig, lambda: asyncio.create_task(graceful_shutdown(sig, tasks))
-        )
+        loop.add_signal_handler(sig, request_shutdown, sig, stop)
 
-    await main()
+    # Starting both the Flask (Quart) app and Telegram bot as tasks
+    server_task = asyncio.create_task(
+        run_flask_app(message_queue, webhook_bot, shutdown_trigger=stop.wait)
+    )
+    bot_task = asyncio.create_task(run_bot(bot, message_queue))
+    stop_task = asyncio.create_task(stop.wait())
+
+    # Wait for the tasks to finish (they won't unless cancelled or stopped)
+    try:
+        await asyncio.wait(
+            [server_task, bot_task, stop_task], return_when=asyncio.FIRST_COMPLETED
+        )
+    finally:
+        stop.set()
+        bot_task.cancel()
+        await asyncio.gather(server_task, bot_task, stop_task, return_exceptions=True)
+        # commit pending writes of a durable queue
+        message_queue.close()
+        print("Shut down, exiting...")
 
 
 if __name__ == "__main__":
-    asyncio.run(async_main())
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+"""
+Coalescing of queued commands: consecutive messages to the same chat are merged
+into as few telegram messages as possible.
+"""
+
+import logging
+from typing import Callable
+
+from .sender import get_chat_id
+
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+MESSAGE_SEPARATOR = "\n\n"
+
+
+def split_text(text: str, limit: int = TELEGRAM_MAX_MESSAGE_LENGTH) -> list[str]:
+    """Split a text in chunks of at most `limit` characters, preferably at line breaks."""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit + 1)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+
+    if text or not chunks:
+        chunks.append(text)
+    return chunks
+
+
+def pack_texts(texts: list[str], limit: int = TELEGRAM_MAX_MESSAGE_LENGTH) -> list[str]:
+    """Join texts in as few messages as possible, none of them longer than `limit`."""
+    messages = []
+    current = None
+    for text in texts:
+        for part in split_text(text, limit):
+            if (
+                current is not None
+                and len(current) + len(MESSAGE_SEPARATOR) + len(part) <= limit
+            ):
+                current += MESSAGE_SEPARATOR + part
+            else:
+                if current is not None:
+                    messages.append(current)
+                current = part
+
+    if current is not None:
+        messages.append(current)
+    return messages
+
+
+def is_coalescable(command_message) -> bool:
+    if not isinstance(command_message, dict):
+        return False
+    data = command_message.get("data")
+    return (
+        command_message.get("command") == "send_message"
+        and isinstance(data, dict)
+        and data.keys() == {"chat_id", "text"}
+        and isinstance(data["chat_id"], (int, str))
+        and isinstance(data["text"], str)
+    )
+
+
+def coalesce_commands(
+    commands: list, destination: Callable[[dict], object] = get_chat_id
+) -> list[tuple[dict, list]]:
+    """
+    Merge the `send_message` commands of a batch per destination chat, keeping the order of the messages
+    of each chat.
+    Returns the resulting commands, each with the queued commands it completes:
+    when a merged text is split, these are attached to its last part.
+    """
+    result = []
+    pending: dict[object, list] = {}
+    # messages saved by merging, split texts may take more messages than their sources
+    n_coalesced = 0
+
+    def flush(chat_id):
+        nonlocal n_coalesced
+        if sources := pending.pop(chat_id, None):
+            texts = pack_texts([c["data"]["text"] for c in sources])
+            n_coalesced += max(len(sources) - len(texts), 0)
+            for i, text in enumerate(texts):
+                command = {
+                    "command": "send_message",
+                    "data": {"chat_id": chat_id, "text": text},
+                }
+                result.append((command, sources if i == len(texts) - 1 else []))
+
+    for command_message in commands:
+        if is_coalescable(command_message):
+            pending.setdefault(destination(command_message), []).append(command_message)
+            continue
+
+        # other commands are kept in place, after the pending messages of their chat
+        if (chat_id := destination(command_message)) is not None:
+            flush(chat_id)
+        result.append((command_message, [command_message]))
+
+    for chat_id in list(pending):
+        flush(chat_id)
+
+    if n_coalesced:
+        logging.info(f"coalesced {n_coalesced} messages")
+    return result
@@ -3,14 +3,49 @@ https://github.com/python-telegram-bot/python-telegram-bot/wiki/Frequently-reque
 """
 
 import asyncio
+import functools
 import logging
-import queue
+import secrets
 
-from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes
+from telegram import Update
+from telegram.ext import Application, ApplicationBuilder, CommandHandler, ContextTypes
 
 from common import utils
 from common.config import PathRegistry as PR
 
+from .batching import coalesce_commands
+from .commands import ChatId
+from .dedup import Deduplicator
+from .message_queue import MessageQueue
+from .ratelimit import RateLimiter
+from .sender import SendScheduler
+from .settings import HttpSettings, Settings
+
+
+def build_application(token: str, http: HttpSettings) -> Application:
+    """
+    Build the telegram application, with separate connection pools for the long polling of updates
+    and for the other requests.
+    """
+    return (
+        ApplicationBuilder()
+        .token(token)
+        .base_url(http.base_url)
+        .http_version(http.http_version)
+        .connection_pool_size(http.connection_pool_size)
+        .connect_timeout(http.connect_timeout)
+        .read_timeout(http.read_timeout)
+        .write_timeout(http.write_timeout)
+        .pool_timeout(http.pool_timeout)
+        .get_updates_http_version(http.get_updates_http_version)
+        .get_updates_connection_pool_size(http.get_updates_connection_pool_size)
+        .get_updates_connect_timeout(http.get_updates_connect_timeout)
+        .get_updates_read_timeout(http.get_updates_read_timeout)
+        .get_updates_write_timeout(http.get_updates_write_timeout)
+        .get_updates_pool_timeout(http.get_updates_pool_timeout)
+        .build()
+    )
+
 
 class TelegramBot:
 
@@ -18,9 +53,45 @@ class TelegramBot:
     PATH_ADMIN = PR.get_config_file("secrets/admin_user.txt")
 
     def __init__(self):
+        self.settings = Settings.load()
         self.token = utils.read_text_file(self.PATH_TOKEN)
-        self.app = ApplicationBuilder().token(self.token).build()
+        self.app = build_application(self.token, self.settings.http)
         self.admin_user = int(utils.read_text_file(self.PATH_ADMIN))
+        self.webhook_secret = (
+            self.settings.webhook.secret_token or secrets.token_urlsafe(32)
+        )
+
+        sending = self.settings.sending
+        self.scheduler = SendScheduler(
+            self.dispatch_command,
+            RateLimiter(
+                sending.global_rate,
+                sending.global_burst,
+                sending.per_chat_rate,
+                sending.per_chat_burst,
+            ),
+            workers=sending.workers,
+            max_retries=sending.max_retries,
+            retry_backoff=sending.retry_backoff,
+            destination=self.get_destination,
+        )
+        dedup = self.settings.dedup
+        self.deduplicator = (
+            Deduplicator(
+                dedup.ttl,
+                dedup.max_entries,
+                dedup.digest_interval,
+                destination=self.get_destination,
+            )
+            if dedup.enabled
+            else None
+        )
+        self.handlers = {
+            "send_message": self.command_send_message,
+            "send_photo": self.command_send_photo,
+            "send_document": self.command_send_document,
+            "edit_message": self.command_edit_message,
+        }
 
     async def command_start(self, update, context: ContextTypes.DEFAULT_TYPE):
         await context.bot.send_message(
@@ -31,43 +102,147 @@ class TelegramBot:
         # Log Errors caused by Updates or notify users of error, etc.
         print(f"Error occurred: {context.error}")
 
-    async def command_send_message(self, chat_id: int, text: str):
+    def get_destination(self, command_message: dict) -> ChatId:
+        """
+        Chat a command is delivered to, keying the send lanes, rate limits, coalescing and deduplication.
+        Commands are sent to the admin user only, whatever their `chat_id`.
+        """
+        return self.admin_user
+
+    async def command_send_message(self, chat_id: ChatId, text: str):
         await self.app.bot.send_message(chat_id=self.admin_user, text=text)
 
-    async def process_queue_messages(self, message_queue: asyncio.Queue):
+    async def command_send_photo(
+        self, chat_id: ChatId, photo: str, caption: str | None = None
+    ):
+        await self.app.bot.send_photo(
+            chat_id=self.admin_user, photo=photo, caption=caption
+        )
+
+    async def command_send_document(
+        self, chat_id: ChatId, document: str, caption: str | None = None
+    ):
+        await self.app.bot.send_document(
+            chat_id=self.admin_user, document=document, caption=caption
+        )
+
+    async def command_edit_message(self, chat_id: ChatId, message_id: int, text: str):
+        await self.app.bot.edit_message_text(
+            chat_id=self.admin_user, message_id=message_id, text=text
+        )
+
+    async def dispatch_command(self, command_message: dict):
+        """Run the handler of a command, validated when it was enqueued."""
+        command = command_message["command"]
+        logging.debug(f"Got command from queue: {command}")
+
+        if (handler := self.handlers.get(command)) is None:
+            logging.warning(f"dropping command without handler: {command}")
+            return
+        await handler(**command_message["data"])
+
+    async def next_batch(self, message_queue: MessageQueue) -> list:
+        """
+        Wait for a queued message, then drain the messages arriving within the batching window.
+        """
+        loop = asyncio.get_running_loop()
+        batch = [await message_queue.get()]
+        deadline = loop.time() + self.settings.batching.window
+        while len(batch) < self.settings.batching.max_size:
+            try:
+                batch.append(message_queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(message_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    def suppress_duplicates(self, batch: list, message_queue: MessageQueue) -> list:
+        if self.deduplicator is None:
+            return batch
+
+        commands, duplicates = [], []
+        for command_message in batch:
+            if self.deduplicator.is_duplicate(command_message):
+                duplicates.append(command_message)
+            else:
+                commands.append(command_message)
+
+        if duplicates:
+            logging.info(f"suppressed {len(duplicates)} repeated messages")
+            message_queue.ack(duplicates)
+        return commands
+
+    async def send_digests(self):
+        if self.deduplicator is None:
+            return
+
+        while True:
+            await asyncio.sleep(self.deduplicator.digest_interval)
+            # the reports of a chat are merged into a single digest message
+            digest = coalesce_commands(self.deduplicator.digest(), self.get_destination)
+            for command_message, _ in digest:
+                self.scheduler.submit(command_message)
+
+    async def process_queue_messages(self, message_queue: MessageQueue):
         logging.debug("starting processing message queue")
         while True:
             logging.info("waiting for queue msg")
-            command_message = await message_queue.get()
-            logging.info("got queue msg")
+            batch = await self.next_batch(message_queue)
+            logging.info(f"got {len(batch)} queue msg")
             try:
-                command = command_message["command"]
-                data = command_message["data"]
-                logging.debug(f"Got command from queue: {command}")
-
-                # Handle the command
-                if command == "send_message":
-                    await self.command_send_message(**data)
-                # Add other command handling as necessary
+                commands = coalesce_commands(
+                    self.suppress_duplicates(batch, message_queue),
+                    self.get_destination,
+                )
 
-            except Exception as e:
-                logging.error(f"Error processing message: {e}")
+                for command_message, sources in commands:
+                    # queued commands are acknowledged once processed
+                    self.scheduler.submit(
+                        command_message,
+                        functools.partial(message_queue.ack, sources),
+                    )
             finally:
-                message_queue.task_done()
+                for _ in batch:
+                    message_queue.task_done()
 
     async def start(self):
         logging.info("starting telegram bot")
         await self.app.initialize()
         await self.app.start()
-        await self.app.updater.start_polling()
+
+        webhook = self.settings.webhook
+        if not webhook.enabled:
+            await self.app.updater.start_polling()
+            return
+
+        # updates are put in the update queue by the API server
+        logging.info(f"receiving updates on webhook {webhook.url}")
+        await self.app.bot.set_webhook(
+            webhook.url,
+            secret_token=self.webhook_secret,
+            max_connections=webhook.max_connections,
+            drop_pending_updates=webhook.drop_pending_updates,
+            allowed_updates=Update.ALL_TYPES,
+        )
 
     async def stop(self):
         logging.info("shutting down telegram bot")
-        await self.app.updater.stop()
+        # the webhook is kept, telegram holds the updates until the bot is back
+        if self.app.updater.running:
+            await self.app.updater.stop()
         await self.app.stop()
         await self.app.shutdown()
 
-    async def run(self, message_queue: queue.Queue):
+    async def run(self, message_queue: MessageQueue):
         # Add handlers
         start_handler = CommandHandler("start", self.start)
         self.app.add_handler(start_handler)
@@ -78,14 +253,17 @@ class TelegramBot:
         # https://github.com/python-telegram-bot/python-telegram-bot/wiki/Frequently-requested-design-patterns#running-ptb-alongside-other-asyncio-frameworks
         await self.start()
         # Start other asyncio frameworks here
-        await self.process_queue_messages(message_queue)
+        await asyncio.gather(
+            self.scheduler.run(),
+            self.process_queue_messages(message_queue),
+            self.send_digests(),
+        )
         # Add some logic that keeps the event loop running until you want to shutdown
         # Stop the other asyncio frameworks here
         await self.stop()
 
 
-async def run_bot(message_queue: asyncio.Queue):
-    bot = TelegramBot()
+async def run_bot(bot: TelegramBot, message_queue: MessageQueue):
     try:
         await bot.run(message_queue)
     except asyncio.CancelledError:
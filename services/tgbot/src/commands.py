@@ -0,0 +1,119 @@
+"""
+Schemas of the commands accepted by the API. Commands are validated when they are enqueued,
+so that the bot only dispatches well-formed commands.
+
+To add a command: declare its data model and command model, add the latter to `Command`,
+and map its name to a handler in `TelegramBot.handlers`.
+"""
+
+from typing import Annotated, Literal, Union
+
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError
+from pydantic_core import from_json
+
+ChatId = int | str
+
+
+class CommandData(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    chat_id: ChatId
+
+
+class SendMessageData(CommandData):
+    text: str = Field(min_length=1)
+
+
+class SendPhotoData(CommandData):
+    # URL or telegram file ID
+    photo: str
+    caption: str | None = None
+
+
+class SendDocumentData(CommandData):
+    # URL or telegram file ID
+    document: str
+    caption: str | None = None
+
+
+class EditMessageData(CommandData):
+    message_id: int
+    text: str = Field(min_length=1)
+
+
+class BaseCommand(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    priority: int = 0
+    # repeats of a command are suppressed by chat and content, or by chat and `dedup_key` if set
+    dedup_key: str | None = None
+
+
+class SendMessage(BaseCommand):
+    command: Literal["send_message"]
+    data: SendMessageData
+
+
+class SendPhoto(BaseCommand):
+    command: Literal["send_photo"]
+    data: SendPhotoData
+
+
+class SendDocument(BaseCommand):
+    command: Literal["send_document"]
+    data: SendDocumentData
+
+
+class EditMessage(BaseCommand):
+    command: Literal["edit_message"]
+    data: EditMessageData
+
+
+# the discriminator selects the schema of a command from its name, without trying the other ones
+Command = Annotated[
+    Union[SendMessage, SendPhoto, SendDocument, EditMessage],
+    Field(discriminator="command"),
+]
+
+# validators are built once, JSON is parsed and validated by pydantic-core in a single pass
+_command_adapter = TypeAdapter(Command)
+
+
+class InvalidCommand(ValueError):
+    pass
+
+
+def format_errors(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(map(str, error['loc'])) or 'command'}: {error['msg']}"
+        for error in e.errors(include_url=False)
+    )
+
+
+def _to_message(command: BaseCommand) -> dict:
+    # queued commands are plain dicts, optional fields left unset are omitted
+    return command.model_dump(exclude_none=True)
+
+
+def parse_command(raw: bytes | str) -> dict:
+    """Parse and validate a JSON command, raise `InvalidCommand` if it is malformed."""
+    try:
+        return _to_message(_command_adapter.validate_json(raw))
+    except ValidationError as e:
+        raise InvalidCommand(format_errors(e)) from None
+
+
+def validate_command(command_message) -> dict:
+    """Validate a decoded command, raise `InvalidCommand` if it is malformed."""
+    try:
+        return _to_message(_command_adapter.validate_python(command_message))
+    except ValidationError as e:
+        raise InvalidCommand(format_errors(e)) from None
+
+
+def parse_json(raw: bytes | str):
+    """Decode a JSON document, raise `InvalidCommand` if it is not valid JSON."""
+    try:
+        return from_json(raw)
+    except ValueError as e:
+        raise InvalidCommand(f"invalid JSON: {e}") from None
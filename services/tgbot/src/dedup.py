@@ -0,0 +1,131 @@
+"""
+Suppression of repeated commands: a command identical to one processed recently is not sent again,
+its repeats are reported in a periodic digest instead.
+"""
+
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable
+
+from .sender import get_chat_id
+
+PREVIEW_LENGTH = 100
+
+
+@dataclass
+class SeenCommand:
+    chat_id: object
+    preview: str
+    last_seen: float
+    suppressed: int = 0
+
+
+def get_preview(command_message: dict) -> str:
+    data = command_message["data"]
+    text = data.get("text") or data.get("caption") or command_message["command"]
+    line = text.strip().split("\n", 1)[0]
+    return line if len(line) <= PREVIEW_LENGTH else line[: PREVIEW_LENGTH - 1] + "…"
+
+
+def format_period(seconds: float) -> str:
+    if seconds % 3600 == 0:
+        hours = int(seconds // 3600)
+        return "hour" if hours == 1 else f"{hours} hours"
+    minutes = max(round(seconds / 60), 1)
+    return "minute" if minutes == 1 else f"{minutes} minutes"
+
+
+class Deduplicator:
+    """
+    LRU of the commands seen in the last `ttl` seconds, keyed by destination chat and content hash, or by
+    destination chat and `dedup_key` when the command has one (e.g. for alerts embedding a timestamp).
+    A repeated command refreshes its entry, so that a flapping alert stays suppressed while it repeats.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        max_entries: int,
+        digest_interval: float,
+        destination: Callable[[dict], object] = get_chat_id,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.digest_interval = digest_interval
+        self.destination = destination
+        # ordered by last seen time
+        self._seen: OrderedDict[tuple, SeenCommand] = OrderedDict()
+        # entries removed from the LRU with suppressed repeats, until the next digest
+        self._removed: list[SeenCommand] = []
+
+    def key(self, command_message: dict) -> tuple:
+        chat_id = self.destination(command_message)
+        if (dedup_key := command_message.get("dedup_key")) is not None:
+            return chat_id, "key", dedup_key
+
+        data = {k: v for k, v in command_message["data"].items() if k != "chat_id"}
+        content = json.dumps([command_message["command"], data], sort_keys=True)
+        return (
+            chat_id,
+            "hash",
+            hashlib.blake2b(content.encode(), digest_size=16).digest(),
+        )
+
+    def _remove(self, key: tuple):
+        seen = self._seen.pop(key)
+        if seen.suppressed:
+            self._removed.append(seen)
+
+    def expire(self, now: float):
+        while self._seen:
+            key, seen = next(iter(self._seen.items()))
+            if now - seen.last_seen < self.ttl:
+                break
+            self._remove(key)
+
+    def is_duplicate(self, command_message: dict) -> bool:
+        """Record a command, return whether it repeats a recent one and must be suppressed."""
+        now = time.monotonic()
+        self.expire(now)
+
+        key = self.key(command_message)
+        if (seen := self._seen.get(key)) is not None:
+            seen.suppressed += 1
+            seen.last_seen = now
+            self._seen.move_to_end(key)
+            return True
+
+        self._seen[key] = SeenCommand(
+            self.destination(command_message), get_preview(command_message), now
+        )
+        if len(self._seen) > self.max_entries:
+            self._remove(next(iter(self._seen)))
+        return False
+
+    def digest(self) -> list[dict]:
+        """
+        Messages reporting the repeats suppressed since the last digest, one per suppressed command,
+        to be merged per chat.
+        """
+        self.expire(time.monotonic())
+        entries = self._removed + [s for s in self._seen.values() if s.suppressed]
+        self._removed = []
+
+        period = format_period(self.digest_interval)
+        messages = []
+        for seen in entries:
+            messages.append(
+                {
+                    "command": "send_message",
+                    "data": {
+                        "chat_id": seen.chat_id,
+                        "text": f"{seen.preview}\n×{seen.suppressed} in the last {period}",
+                    },
+                }
+            )
+            seen.suppressed = 0
+
+        return messages
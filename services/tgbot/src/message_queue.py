@@ -0,0 +1,263 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from collections import deque
+from enum import Enum
+from pathlib import Path
+
+from common.config import PathRegistry as PR
+
+
+class OverflowPolicy(str, Enum):
+    # refuse new commands, producers are asked to retry later
+    REJECT = "reject"
+    # drop the oldest queued command
+    DROP_OLDEST = "drop_oldest"
+    # drop the oldest queued command of lowest priority, or refuse the new one if its priority is lower
+    DROP_PRIORITY = "drop_priority"
+
+
+def get_priority(command_message) -> int:
+    priority = (
+        command_message.get("priority", 0) if isinstance(command_message, dict) else 0
+    )
+    return priority if isinstance(priority, int) else 0
+
+
+class MessageQueue(asyncio.Queue):
+    """
+    Queue of commands with an optional bound and an overflow policy, keeping track of enqueue times.
+    Commands taken by the consumer count toward the bound until they are acknowledged, so that the bound
+    also covers the commands waiting to be sent.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 0,
+        overflow: OverflowPolicy = OverflowPolicy.REJECT,
+        retry_after: float = 5,
+    ):
+        super().__init__(maxsize)
+        self.overflow = OverflowPolicy(overflow)
+        self.retry_after = retry_after
+        self.dropped = 0
+        self.rejected = 0
+        # items handed to consumers and not acknowledged yet, with their row id (None if not persisted),
+        # by id: the reference keeps the id from being reused by another item until the ack
+        self._inflight: dict[int, tuple[object, int | None]] = {}
+
+    # asyncio.Queue storage hooks, items are stored with their enqueue time
+    def _init(self, maxsize):
+        self._queue = deque()
+
+    def _put(self, item):
+        self._queue.append((time.monotonic(), item))
+
+    def _get(self):
+        item = self._queue.popleft()[1]
+        self._inflight[id(item)] = (item, None)
+        return item
+
+    def _is_inflight(self, item) -> bool:
+        entry = self._inflight.get(id(item))
+        return entry is not None and entry[0] is item
+
+    def full(self) -> bool:
+        return 0 < self.maxsize <= self.qsize() + len(self._inflight)
+
+    def _drop(self, index: int):
+        del self._queue[index]
+        self.task_done()
+        self.dropped += 1
+
+    def _make_room(self, item) -> bool:
+        # in-flight commands are not dropped
+        if not self._queue:
+            return False
+
+        if self.overflow == OverflowPolicy.DROP_OLDEST:
+            self._drop(0)
+            return True
+
+        if self.overflow == OverflowPolicy.DROP_PRIORITY:
+            index = min(
+                range(len(self._queue)),
+                key=lambda i: (get_priority(self._queue[i][1]), i),
+            )
+            if get_priority(self._queue[index][1]) < get_priority(item):
+                self._drop(index)
+                return True
+
+        return False
+
+    def offer(self, item) -> bool:
+        """Enqueue without waiting, applying the overflow policy if the queue is full."""
+        if self.full() and not self._make_room(item):
+            self.rejected += 1
+            return False
+
+        self.put_nowait(item)
+        return True
+
+    def ack(self, items: list):
+        """Acknowledge processed items, freeing their room in the queue."""
+        for item in items:
+            if self._is_inflight(item):
+                del self._inflight[id(item)]
+                self._wakeup_next(self._putters)
+
+    async def sync(self):
+        """Wait until the accepted items are persisted, no-op for an in-memory queue."""
+
+    def close(self):
+        pass
+
+    def stats(self) -> dict:
+        oldest = time.monotonic() - self._queue[0][0] if self._queue else 0.0
+        return {
+            "depth": self.qsize(),
+            "inflight": len(self._inflight),
+            "maxsize": self.maxsize,
+            "oldest_age_s": round(oldest, 3),
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+        }
+
+
+class DurableMessageQueue(MessageQueue):
+    """
+    MessageQueue persisted in SQLite (WAL mode), for at-least-once delivery: commands are stored on enqueue,
+    deleted once acknowledged, and replayed on startup.
+
+    Writes are grouped in a transaction committed every `commit_interval` seconds. Unless `fsync_commits` is set,
+    commits are not synced to disk (synchronous=NORMAL), only WAL checkpoints are.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        maxsize: int = 0,
+        overflow: OverflowPolicy = OverflowPolicy.REJECT,
+        retry_after: float = 5,
+        commit_interval: float = 0.05,
+        fsync_commits: bool = False,
+    ):
+        super().__init__(maxsize, overflow, retry_after)
+        self.commit_interval = commit_interval
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # transactions are handled explicitly
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"PRAGMA synchronous={'FULL' if fsync_commits else 'NORMAL'}")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages "
+            "(id INTEGER PRIMARY KEY AUTOINCREMENT, enqueued_at REAL, payload TEXT)"
+        )
+        self._commit_handle: asyncio.TimerHandle | None = None
+        # resolved by the commit of the current transaction, for the writers waiting for it
+        self._committed: asyncio.Future | None = None
+        self._replay_id: int | None = None
+        self._replay()
+
+    def _replay(self):
+        rows = self._db.execute(
+            "SELECT id, enqueued_at, payload FROM messages ORDER BY id"
+        ).fetchall()
+        for i, (row_id, enqueued_at, payload) in enumerate(rows):
+            self._replay_id = row_id
+            try:
+                self.put_nowait(json.loads(payload))
+            except asyncio.QueueFull:
+                logging.warning(
+                    f"queue full, {len(rows) - i} commands will be replayed on next startup"
+                )
+                break
+            finally:
+                self._replay_id = None
+            # keep the age of replayed commands
+            age = time.time() - enqueued_at
+            self._queue[-1] = (time.monotonic() - age, *self._queue[-1][1:])
+
+        if self.qsize():
+            logging.info(f"replayed {self.qsize()} queued commands")
+
+    def _write(self, sql: str, params: tuple) -> sqlite3.Cursor:
+        if not self._db.in_transaction:
+            self._db.execute("BEGIN")
+        if self._commit_handle is None:
+            self._commit_handle = asyncio.get_running_loop().call_later(
+                self.commit_interval, self._commit
+            )
+        return self._db.execute(sql, params)
+
+    def _commit(self):
+        self._commit_handle = None
+        committed, self._committed = self._committed, None
+        try:
+            if self._db.in_transaction:
+                self._db.execute("COMMIT")
+        except sqlite3.Error as e:
+            if committed is not None:
+                committed.set_exception(e)
+            raise
+        if committed is not None:
+            committed.set_result(None)
+
+    async def sync(self):
+        """Wait for the commit of the pending writes, i.e. up to `commit_interval` seconds."""
+        if not self._db.in_transaction:
+            return
+        if self._committed is None:
+            self._committed = asyncio.get_running_loop().create_future()
+        # several writers wait for the same commit
+        await asyncio.shield(self._committed)
+
+    def _put(self, item):
+        if (row_id := self._replay_id) is None:
+            row_id = self._write(
+                "INSERT INTO messages (enqueued_at, payload) VALUES (?, ?)",
+                (time.time(), json.dumps(item)),
+            ).lastrowid
+        self._queue.append((time.monotonic(), item, row_id))
+
+    def _get(self):
+        _, item, row_id = self._queue.popleft()
+        self._inflight[id(item)] = (item, row_id)
+        return item
+
+    def _drop(self, index: int):
+        self._write("DELETE FROM messages WHERE id = ?", (self._queue[index][2],))
+        super()._drop(index)
+
+    def ack(self, items: list):
+        for item in items:
+            if (
+                self._is_inflight(item)
+                and (row_id := self._inflight[id(item)][1]) is not None
+            ):
+                self._write("DELETE FROM messages WHERE id = ?", (row_id,))
+        super().ack(items)
+
+    def close(self):
+        if self._commit_handle is not None:
+            self._commit_handle.cancel()
+        self._commit()
+        self._db.close()
+
+
+def create_message_queue(settings) -> MessageQueue:
+    """Create the message queue described by the queue settings."""
+    if not settings.durable:
+        return MessageQueue(settings.maxsize, settings.overflow, settings.retry_after)
+
+    return DurableMessageQueue(
+        PR.PATH_ROOT / settings.path,
+        settings.maxsize,
+        settings.overflow,
+        settings.retry_after,
+        commit_interval=settings.commit_interval,
+        fsync_commits=settings.fsync_commits,
+    )
@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Asynchronous token bucket, refilled with `rate` tokens per second up to `capacity` tokens."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    @property
+    def is_idle(self) -> bool:
+        now = time.monotonic()
+        self._refill(now)
+        return self._tokens >= self.capacity and now >= self._blocked_until
+
+    async def acquire(self):
+        # the lock makes waiters acquire tokens in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                delay = self._blocked_until - now
+                if delay <= 0 and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep(max(delay, (1 - self._tokens) / self.rate))
+
+    def block(self, seconds: float):
+        """Don't hand out tokens for `seconds`, e.g. when asked to retry after some time."""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+class RateLimiter:
+    """Global and per-chat token buckets, matching telegram's rate limits."""
+
+    # idle per-chat buckets are dropped above this number of chats
+    MAX_CHAT_BUCKETS = 1000
+
+    def __init__(
+        self,
+        global_rate: float,
+        global_burst: float,
+        per_chat_rate: float,
+        per_chat_burst: float,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self._chat_buckets: dict[object, TokenBucket] = {}
+
+    def chat_bucket(self, chat_id) -> TokenBucket:
+        if (bucket := self._chat_buckets.get(chat_id)) is None:
+            if len(self._chat_buckets) >= self.MAX_CHAT_BUCKETS:
+                self._chat_buckets = {
+                    k: b for k, b in self._chat_buckets.items() if not b.is_idle
+                }
+            bucket = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+            self._chat_buckets[chat_id] = bucket
+
+        return bucket
+
+    async def acquire(self, chat_id):
+        await self.chat_bucket(chat_id).acquire()
+        await self.global_bucket.acquire()
+
+    def retry_after(self, chat_id, seconds: float):
+        self.chat_bucket(chat_id).block(seconds)
@@ -1,30 +1,167 @@
 import asyncio
+import functools
+import hmac
 import logging
+from typing import AsyncIterator, Awaitable, Callable
 
 from quart import Quart, jsonify, request
+from telegram import Update
 
 from common.config import PathRegistry as PR
 
+from .bot import TelegramBot
+from .commands import InvalidCommand, parse_command, parse_json, validate_command
+from .message_queue import MessageQueue
+
 app = Quart(__name__)
-message_queue: asyncio.Queue = None
+message_queue: MessageQueue = None
+# bot receiving its updates on the webhook route, if enabled
+webhook_bot: TelegramBot | None = None
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
 
 
-async def run_flask_app(shared_queue: asyncio.Queue):
-    global message_queue
+async def run_flask_app(
+    shared_queue: MessageQueue,
+    bot: TelegramBot | None = None,
+    shutdown_trigger: Callable[[], Awaitable] | None = None,
+):
+    """Run the API server until `shutdown_trigger` returns (by default, until SIGINT or SIGTERM)."""
+    global message_queue, webhook_bot
     message_queue = shared_queue
+    webhook_bot = bot
     try:
         path_cert = PR.get_config_file("secrets/certificate.pem")
         path_key = PR.get_config_file("secrets/key.pem")
         await app.run_task(
-            host="0.0.0.0", debug=False, certfile=path_cert, keyfile=path_key
+            host="0.0.0.0",
+            debug=False,
+            certfile=path_cert,
+            keyfile=path_key,
+            shutdown_trigger=shutdown_trigger,
         )
     except asyncio.CancelledError:
         logging.info("api server shut down")
 
 
+def enqueue(command_message: dict) -> bool:
+    return message_queue.offer(command_message)
+
+
+def queue_full_response():
+    return (
+        jsonify({"status": "error", "message": "Queue full"}),
+        429,
+        {"Retry-After": str(round(message_queue.retry_after))},
+    )
+
+
 @app.route("/enqueue_command", methods=["POST"])
 async def enqueue_command():
-    command_message = await request.get_json()
+    try:
+        command_message = parse_command(await request.get_data())
+    except InvalidCommand as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
 
-    await message_queue.put(command_message)
+    if not enqueue(command_message):
+        return queue_full_response()
+    # the command is acknowledged once persisted by a durable queue
+    await message_queue.sync()
     return jsonify({"status": "success", "message": "Command enqueued"})
+
+
+async def iter_ndjson(body) -> AsyncIterator[bytes]:
+    """Split a streamed NDJSON body in lines."""
+    buffer = b""
+    async for chunk in body:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+async def iter_commands() -> AsyncIterator[Callable[[], dict]]:
+    """
+    Commands of a bulk request, each as a function returning the validated command
+    or raising `InvalidCommand`.
+    """
+    if request.mimetype == "application/x-ndjson":
+        async for line in iter_ndjson(request.body):
+            yield functools.partial(parse_command, line)
+        return
+
+    command_messages = parse_json(await request.get_data())
+    if not isinstance(command_messages, list):
+        raise InvalidCommand("expected a JSON array")
+    for command_message in command_messages:
+        yield functools.partial(validate_command, command_message)
+
+
+@app.route("/enqueue_commands", methods=["POST"])
+async def enqueue_commands():
+    """
+    Enqueue several commands, sent as a JSON array or as a streamed NDJSON body
+    (`Content-Type: application/x-ndjson`), and report the result of each command.
+    """
+    results = []
+    enqueued = 0
+    queue_full = False
+    try:
+        async for get_command in iter_commands():
+            try:
+                command_message = get_command()
+            except InvalidCommand as e:
+                results.append({"status": "error", "message": str(e)})
+                continue
+
+            if enqueue(command_message):
+                enqueued += 1
+                results.append({"status": "success"})
+            else:
+                queue_full = True
+                results.append({"status": "error", "message": "Queue full"})
+    except InvalidCommand as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    await message_queue.sync()
+    headers = (
+        {"Retry-After": str(round(message_queue.retry_after))} if queue_full else {}
+    )
+    return (
+        jsonify(
+            {
+                "status": "success" if enqueued == len(results) else "partial",
+                "enqueued": enqueued,
+                "failed": len(results) - enqueued,
+                "results": results,
+            }
+        ),
+        200,
+        headers,
+    )
+
+
+@app.route("/telegram/webhook", methods=["POST"])
+async def telegram_webhook():
+    """Receive an update pushed by telegram and hand it over to the bot application."""
+    if webhook_bot is None:
+        return jsonify({"status": "error", "message": "Webhook disabled"}), 404
+
+    token = request.headers.get(SECRET_TOKEN_HEADER, "")
+    if not hmac.compare_digest(token, webhook_bot.webhook_secret):
+        return jsonify({"status": "error", "message": "Invalid secret token"}), 403
+
+    data = await request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"status": "error", "message": "Invalid update"}), 400
+
+    await webhook_bot.app.update_queue.put(Update.de_json(data, webhook_bot.app.bot))
+    return jsonify({"status": "success"})
+
+
+@app.route("/queue_stats", methods=["GET"])
+async def queue_stats():
+    return jsonify(message_queue.stats())
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+from collections import deque
+from datetime import timedelta
+from typing import Awaitable, Callable
+
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from .ratelimit import RateLimiter
+
+# maximum delay between two retries after a network error, in seconds
+MAX_BACKOFF = 60
+
+
+def get_chat_id(command_message) -> object:
+    """`chat_id` of a command, None if it has none."""
+    data = command_message.get("data") if isinstance(command_message, dict) else None
+    chat_id = data.get("chat_id") if isinstance(data, dict) else None
+    return chat_id if isinstance(chat_id, (int, str)) else None
+
+
+class SendScheduler:
+    """
+    Pool of sender workers. The commands of a chat are processed in order, by one worker at a time,
+    while the commands of different chats are processed in parallel, within the rate limits.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[dict], Awaitable],
+        rate_limiter: RateLimiter,
+        workers: int,
+        max_retries: int,
+        retry_backoff: float = 1,
+        destination: Callable[[dict], object] = get_chat_id,
+    ):
+        self.send = send
+        self.rate_limiter = rate_limiter
+        self.workers = workers
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        # chat a command is delivered to, which keys the lanes and the rate limits
+        self.destination = destination
+        # pending commands of the chats being processed
+        self._lanes: dict[object, deque] = {}
+        # chats having pending commands and not handled by a worker
+        self._ready: asyncio.Queue = asyncio.Queue()
+
+    def submit(self, command_message: dict, on_done: Callable[[], None] | None = None):
+        """
+        Schedule a command, `on_done` is called once it is processed (sent, or failed with a permanent
+        error), but not if the scheduler is stopped before.
+        """
+        chat_id = self.destination(command_message)
+        if (lane := self._lanes.get(chat_id)) is not None:
+            lane.append((command_message, on_done))
+        else:
+            self._lanes[chat_id] = deque([(command_message, on_done)])
+            self._ready.put_nowait(chat_id)
+
+    async def send_with_retry(self, chat_id, command_message: dict) -> bool:
+        """
+        Send a command, retrying on rate limiting and network errors, with an exponential backoff for the latter.
+        Return whether it was sent, other errors (e.g. bad request, forbidden chat) are raised.
+        """
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire(chat_id)
+            try:
+                await self.send(command_message)
+                return True
+            except RetryAfter as e:
+                delay = e.retry_after
+                if isinstance(delay, timedelta):
+                    delay = delay.total_seconds()
+                logging.warning(f"rate limited on chat {chat_id}, retrying in {delay}s")
+                self.rate_limiter.retry_after(chat_id, delay)
+            except BadRequest:
+                # subclass of NetworkError, but sending it again fails the same way
+                raise
+            except NetworkError as e:
+                delay = min(self.retry_backoff * 2**attempt, MAX_BACKOFF)
+                logging.warning(
+                    f"error sending to chat {chat_id} ({e}), retrying in {delay}s"
+                )
+                self.rate_limiter.retry_after(chat_id, delay)
+
+        return False
+
+    async def worker(self):
+        while True:
+            chat_id = await self._ready.get()
+            lane = self._lanes[chat_id]
+            command_message, on_done = lane.popleft()
+            try:
+                try:
+                    done = await self.send_with_retry(chat_id, command_message)
+                except Exception:
+                    # permanent error, the command is given up
+                    logging.exception(
+                        f"error processing command {command_message.get('command')} to chat {chat_id}"
+                    )
+                    done = True
+
+                if done:
+                    if on_done is not None:
+                        on_done()
+                else:
+                    # still failing after the retries: the command stays first of its lane, unacknowledged,
+                    # and the chat is paused for the last delay
+                    logging.error(
+                        f"sending to chat {chat_id} failed after {self.max_retries} retries, requeuing"
+                    )
+                    lane.appendleft((command_message, on_done))
+            finally:
+                # requeue the chat behind the other ones for fairness
+                if lane:
+                    self._ready.put_nowait(chat_id)
+                else:
+                    del self._lanes[chat_id]
+
+    async def run(self):
+        await asyncio.gather(*(self.worker() for _ in range(self.workers)))
@@ -0,0 +1,97 @@
+from dataclasses import dataclass, field
+
+from common.config import load_config
+
+
+@dataclass
+class QueueSettings:
+    # 0 for an unbounded queue
+    maxsize: int = 10000
+    overflow: str = "reject"
+    retry_after: float = 5
+    # persist queued commands in a SQLite database
+    durable: bool = False
+    path: str = "data/queue.sqlite3"
+    commit_interval: float = 0.05
+    fsync_commits: bool = False
+
+
+@dataclass
+class BatchingSettings:
+    window: float = 0.2
+    max_size: int = 100
+
+
+@dataclass
+class SendingSettings:
+    workers: int = 8
+    global_rate: float = 30
+    global_burst: float = 30
+    per_chat_rate: float = 1
+    per_chat_burst: float = 3
+    max_retries: int = 3
+    retry_backoff: float = 1
+
+
+@dataclass
+class HttpSettings:
+    base_url: str = "https://api.telegram.org/bot"
+    # requests of the send workers, multiplexed on a single connection with HTTP/2
+    http_version: str = "2"
+    connection_pool_size: int = 16
+    connect_timeout: float = 5
+    read_timeout: float = 10
+    write_timeout: float = 10
+    pool_timeout: float = 5
+    # long polling of updates, on its own connection
+    get_updates_http_version: str = "1.1"
+    get_updates_connection_pool_size: int = 1
+    get_updates_connect_timeout: float = 5
+    # added to the long polling timeout
+    get_updates_read_timeout: float = 5
+    get_updates_write_timeout: float = 5
+    get_updates_pool_timeout: float = 1
+
+
+@dataclass
+class WebhookSettings:
+    # receive updates on the API server instead of long polling
+    enabled: bool = False
+    # public URL forwarded to the webhook route of the API server
+    url: str = ""
+    # random secret generated on startup if empty
+    secret_token: str = ""
+    max_connections: int = 40
+    drop_pending_updates: bool = False
+
+
+@dataclass
+class DedupSettings:
+    enabled: bool = True
+    ttl: float = 3600
+    max_entries: int = 10000
+    digest_interval: float = 3600
+
+
+@dataclass
+class Settings:
+    """Bot settings, loaded from `config/tgbot.yaml`."""
+
+    queue: QueueSettings = field(default_factory=QueueSettings)
+    batching: BatchingSettings = field(default_factory=BatchingSettings)
+    sending: SendingSettings = field(default_factory=SendingSettings)
+    dedup: DedupSettings = field(default_factory=DedupSettings)
+    http: HttpSettings = field(default_factory=HttpSettings)
+    webhook: WebhookSettings = field(default_factory=WebhookSettings)
+
+    @classmethod
+    def load(cls) -> "Settings":
+        cfg = load_config("tgbot.yaml")
+        return cls(
+            queue=QueueSettings(**cfg.get("queue", {})),
+            batching=BatchingSettings(**cfg.get("batching", {})),
+            sending=SendingSettings(**cfg.get("sending", {})),
+            dedup=DedupSettings(**cfg.get("dedup", {})),
+            http=HttpSettings(**cfg.get("http", {})),
+            webhook=WebhookSettings(**cfg.get("webhook", {})),
+        )
@@ -0,0 +1,222 @@
+"""
+Load test of the bot: commands are enqueued at a given rate and concurrency, while the queue depth is sampled,
+and delivery latencies are read from the fake telegram server (`tools/fake_telegram.py`).
+
+    python tools/fake_telegram.py --port 8081
+    # run the bot with `http.base_url: http://localhost:8081/bot`
+    python tools/benchmark.py --rate 200 --count 2000 --chats 20
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+import httpx
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+class Benchmark:
+    def __init__(self, options: argparse.Namespace):
+        self.options = options
+        self.enqueue_latencies: list[float] = []
+        self.statuses = Counter()
+        self.accepted: set[int] = set()
+        # (seconds since start, queue stats)
+        self.depth_samples: list[tuple[float, dict]] = []
+        self.start = 0.0
+
+    def command(self, bench_id: int) -> dict:
+        chat_id = random.randrange(self.options.chats)
+        return {
+            "command": "send_message",
+            "data": {
+                "chat_id": chat_id,
+                "text": f"#bench {bench_id} {time.time():.6f}",
+            },
+            # distinct messages, not to be suppressed as repeats
+            "dedup_key": str(bench_id),
+        }
+
+    async def producer(self, client: httpx.AsyncClient, ids: asyncio.Queue):
+        while True:
+            try:
+                bench_id = ids.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            if self.options.rate:
+                # open loop: commands are sent on schedule, whatever the response times
+                delay = self.start + bench_id / self.options.rate - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            started = time.monotonic()
+            try:
+                response = await client.post(
+                    "/enqueue_command", json=self.command(bench_id)
+                )
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            self.enqueue_latencies.append(time.monotonic() - started)
+            self.statuses[status] += 1
+            if status == 200:
+                self.accepted.add(bench_id)
+
+    async def sample_queue(self, client: httpx.AsyncClient, stop: asyncio.Event):
+        while not stop.is_set():
+            try:
+                response = await client.get("/queue_stats")
+                self.depth_samples.append(
+                    (time.monotonic() - self.start, response.json())
+                )
+            except httpx.HTTPError:
+                pass
+            try:
+                await asyncio.wait_for(stop.wait(), self.options.sample_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def wait_delivery(self, fake: httpx.AsyncClient) -> dict:
+        deadline = time.monotonic() + self.options.drain_timeout
+        while True:
+            stats = (await fake.get("/stats")).json()
+            delivered = {int(i) for i in stats["latencies"]}
+            if self.accepted <= delivered or time.monotonic() > deadline:
+                return stats
+            await asyncio.sleep(0.2)
+
+    async def run(self) -> dict:
+        options = self.options
+        async with httpx.AsyncClient(
+            base_url=options.url, verify=False, timeout=30
+        ) as client, httpx.AsyncClient(base_url=options.fake_url) as fake:
+            await fake.post("/reset")
+
+            ids = asyncio.Queue()
+            for i in range(options.count):
+                ids.put_nowait(i)
+
+            stop = asyncio.Event()
+            self.start = time.monotonic()
+            sampler = asyncio.create_task(self.sample_queue(client, stop))
+            await asyncio.gather(
+                *(self.producer(client, ids) for _ in range(options.concurrency))
+            )
+            enqueue_duration = time.monotonic() - self.start
+
+            fake_stats = await self.wait_delivery(fake)
+            stop.set()
+            await sampler
+            queue_stats = (await client.get("/queue_stats")).json()
+
+        return self.report(enqueue_duration, fake_stats, queue_stats)
+
+    def report(
+        self, enqueue_duration: float, fake_stats: dict, queue_stats: dict
+    ) -> dict:
+        latencies = fake_stats["latencies"]
+        delivered = [latencies[str(i)] for i in self.accepted if str(i) in latencies]
+        depths = [s["depth"] for _, s in self.depth_samples]
+        return {
+            "commands": self.options.count,
+            "enqueue_duration_s": round(enqueue_duration, 3),
+            "enqueue_rate": round(self.options.count / enqueue_duration, 1),
+            "statuses": {str(k): v for k, v in self.statuses.items()},
+            "enqueue_latency_ms": {
+                f"p{p}": round(percentile(self.enqueue_latencies, p) * 1000, 2)
+                for p in (50, 90, 99, 100)
+            },
+            "delivered": len(delivered),
+            "lost": len(self.accepted) - len(delivered),
+            "delivery_latency_ms": {
+                f"p{p}": round(percentile(delivered, p) * 1000, 2)
+                for p in (50, 90, 99, 100)
+            },
+            "telegram_requests": fake_stats["messages"],
+            "retried": fake_stats["rate_limited"],
+            "queue_dropped": queue_stats["dropped"],
+            "queue_rejected": queue_stats["rejected"],
+            "queue_depth_max": max(depths, default=0),
+            "queue_inflight_max": max(
+                (s["inflight"] for _, s in self.depth_samples), default=0
+            ),
+            "queue_depth": [
+                [round(t, 2), s["depth"], s["inflight"], s["oldest_age_s"]]
+                for t, s in self.depth_samples
+            ],
+        }
+
+
+def print_report(report: dict):
+    print(
+        f"enqueued {report['commands']} commands in {report['enqueue_duration_s']}s "
+        f"({report['enqueue_rate']}/s), statuses: {report['statuses']}"
+    )
+    print(f"enqueue latency: {report['enqueue_latency_ms']}")
+    print(
+        f"delivered {report['delivered']} ({report['lost']} lost) "
+        f"in {report['telegram_requests']} telegram messages, {report['retried']} rate limited"
+    )
+    print(f"delivery latency: {report['delivery_latency_ms']}")
+    print(
+        f"queue: max depth {report['queue_depth_max']}, max in flight {report['queue_inflight_max']}, "
+        f"{report['queue_dropped']} dropped, {report['queue_rejected']} rejected"
+    )
+    for t, depth, inflight, age in report["queue_depth"]:
+        print(
+            f"  t={t:7.2f}s depth={depth:6d} in flight={inflight:6d} oldest={age:.3f}s"
+        )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load test of the telegram bot.")
+    parser.add_argument(
+        "--url", default="https://localhost:5000", help="bot API server"
+    )
+    parser.add_argument(
+        "--fake-url", default="http://localhost:8081", help="fake telegram server"
+    )
+    parser.add_argument("--count", type=int, default=1000, help="commands to enqueue")
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=100,
+        help="commands per second, 0 to enqueue as fast as the concurrency allows",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=10, help="concurrent enqueue requests"
+    )
+    parser.add_argument("--chats", type=int, default=10, help="distinct chat IDs")
+    parser.add_argument(
+        "--sample-interval",
+        type=float,
+        default=0.5,
+        help="seconds between queue samples",
+    )
+    parser.add_argument(
+        "--drain-timeout",
+        type=float,
+        default=60,
+        help="seconds to wait for the delivery of the enqueued commands",
+    )
+    parser.add_argument("--json", help="write the report to this JSON file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    result = asyncio.run(Benchmark(args).run())
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(result, fh, indent=2)
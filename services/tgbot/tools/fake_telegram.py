@@ -0,0 +1,145 @@
+"""
+Fake telegram bot API server for load tests: the bot is pointed at it with `http.base_url`
+(e.g. `http://localhost:8081/bot`). Messages are accepted after a simulated latency, within an optional
+rate limit answered with `429` like telegram, and the delivery latency of benchmark messages is recorded.
+
+Benchmark messages carry lines `#bench <id> <unix time of enqueue>`, several of them when coalesced.
+
+    python tools/fake_telegram.py --port 8081 --latency 0.05 --rate-limit 30
+"""
+
+import argparse
+import asyncio
+import re
+import time
+
+from quart import Quart, jsonify, request
+
+BENCH_PATTERN = re.compile(r"#bench (\d+) ([\d.]+)")
+
+app = Quart(__name__)
+options: argparse.Namespace = None
+
+
+class Stats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.messages = 0
+        self.rate_limited = 0
+        # benchmark message ID -> delivery latency in seconds
+        self.latencies: dict[int, float] = {}
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+    def allow(self) -> bool:
+        """Fixed one-second window rate limit, as coarse as telegram's."""
+        if not options.rate_limit:
+            return True
+
+        now = time.monotonic()
+        if now - self._window_start >= 1:
+            self._window_start = now
+            self._window_count = 0
+        self._window_count += 1
+        return self._window_count <= options.rate_limit
+
+
+stats = Stats()
+
+
+def ok(result):
+    return jsonify({"ok": True, "result": result})
+
+
+def message_result(params: dict) -> dict:
+    stats.messages += 1
+    return {
+        "message_id": stats.messages,
+        "date": int(time.time()),
+        "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+        "text": params.get("text") or params.get("caption") or "",
+    }
+
+
+@app.route("/bot<token>/<method>", methods=["GET", "POST"])
+async def bot_api(token: str, method: str):
+    stats.requests += 1
+    params = dict(await request.form)
+    params.update(await request.get_json(silent=True) or {})
+
+    if method == "getMe":
+        return ok(
+            {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        )
+    if method == "getUpdates":
+        # nothing to report, answer when the long polling timeout expires
+        await asyncio.sleep(min(float(params.get("timeout", 0)), 10))
+        return ok([])
+    if method in ("setWebhook", "deleteWebhook"):
+        return ok(True)
+
+    if not stats.allow():
+        stats.rate_limited += 1
+        return (
+            jsonify(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1},
+                }
+            ),
+            429,
+        )
+
+    await asyncio.sleep(options.latency)
+    received = time.time()
+    for bench_id, sent in BENCH_PATTERN.findall(params.get("text", "")):
+        stats.latencies[int(bench_id)] = received - float(sent)
+
+    return ok(message_result(params))
+
+
+@app.route("/stats", methods=["GET"])
+async def get_stats():
+    return jsonify(
+        {
+            "requests": stats.requests,
+            "messages": stats.messages,
+            "rate_limited": stats.rate_limited,
+            "latencies": stats.latencies,
+        }
+    )
+
+
+@app.route("/reset", methods=["POST"])
+async def reset():
+    stats.reset()
+    return jsonify({"status": "success"})
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Fake telegram bot API server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="seconds taken by each API call",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=int,
+        default=30,
+        help="messages per second accepted before answering 429, 0 for no limit",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    options = parse_args()
+    app.run(host=options.host, port=options.port)